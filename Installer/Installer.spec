@@ -9,7 +9,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('Icon.ico', '.')],
-    hiddenimports=['tkinter', 'tkinter.messagebox', 'tkinter.filedialog', 'ttkbootstrap', 'huggingface_hub', 'sync', 'wmi', 'speedtest'],
+    hiddenimports=['tkinter', 'tkinter.messagebox', 'tkinter.filedialog', 'ttkbootstrap', 'huggingface_hub', 'sync', 'wmi', 'speedtest', 'manifest', 'downloader', 'ini_index', 'telemetry', 'store', 'migrate', 'verify', 'timing', 'logcapture', 'progress', 'shards', 'staging', 'xetcache'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
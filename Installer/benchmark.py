@@ -0,0 +1,151 @@
+import sys, json, time, shutil, argparse, platform, tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import sync
+import speedtest as hf_speedtest
+from fakehub import FakeHub, make_tree, touch_tree
+from shards import pack_folder
+from ini_index import TEXTURE_SUFFIXES, scan_install, update_index, referenced_textures, remove_orphans
+from speedtest import SPEED_TEST_REPO_ID, SPEED_TEST_FILENAME
+from timing import PhaseTimer
+
+VARIANT = "Core"
+VARIANT_FOLDERS = sync.VARIANT_MAP[VARIANT]["repo_folders"]
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+def pack_tree(repo_root):
+    for folder_name in VARIANT_FOLDERS:
+        pack_folder(repo_root, folder_name)
+
+class Benchmark:
+    """
+    Times installer scenarios against a FakeHub serving a synthetic tree.
+    Each scenario records wall time plus the requests and bytes the hub served.
+    """
+    def __init__(self, work_dir, hub, endpoint, workers=None, profile_prefix=None, packed=False):
+        self.mods_folder = Path(work_dir) / "Mods"
+        self.mods_folder.mkdir(parents=True, exist_ok=True)
+        self.hub, self.endpoint, self.workers = hub, endpoint, workers
+        self.profile_prefix = profile_prefix
+        self.packed = packed
+        self.results = {}
+
+    def timed(self, name, run):
+        self.hub.reset_counters()
+        started = time.perf_counter()
+        outcome = run()
+        seconds = time.perf_counter() - started
+        self.results[name] = {"seconds": round(seconds, 3), **self.hub.counters(), **(outcome or {})}
+        print(f"{name}: {seconds:.2f}s", file=sys.stderr)
+
+    def sync(self, remote_revision=None):
+        timer = PhaseTimer()
+        success, message = sync.sync_repo(str(self.mods_folder), VARIANT, False, remote_revision=remote_revision,
+                                          max_workers=self.workers, telemetry=False, endpoints=[self.endpoint],
+                                          timer=timer, profile_path=self.profile_path(len(self.results)),
+                                          packed=self.packed)
+        if not success:
+            raise RuntimeError(message)
+        return {"files": len(sync.load_manifest(self.install_dir)["files"]), "timings": timer.spans}
+
+    def profile_path(self, index):
+        return f"{self.profile_prefix}_{index}.txt" if self.profile_prefix else None
+
+    def verify(self, full):
+        success, message = sync.verify_repo(str(self.mods_folder), VARIANT, False, full=full,
+                                            max_workers=self.workers, endpoints=[self.endpoint])
+        if not success:
+            raise RuntimeError(message)
+
+    @property
+    def install_dir(self):
+        return sync.get_install_dir(self.mods_folder, VARIANT)
+
+    def cleanup(self, orphans):
+        """Adds unreferenced textures to the install and times finding and removing them."""
+        for i in range(orphans):
+            (self.install_dir / VARIANT_FOLDERS[0] / f"stale_{i:05d}.dds").write_bytes(b"\0" * 1024)
+
+        def run():
+            ini_files, texture_files = scan_install(self.install_dir)
+            referenced = referenced_textures(update_index(self.install_dir, ini_files))
+            return {"removed": len(remove_orphans(self.install_dir, texture_files, referenced))}
+
+        self.timed("cleanup", run)
+
+    def run(self, repo_root, orphans, touch_fraction, speed_test_seconds):
+        self.timed("full_install", self.sync)
+        self.timed("noop_up_to_date", lambda: self.sync(self.hub.revision))
+        self.timed("noop_relisted", self.sync)
+        changed = touch_tree(repo_root, touch_fraction)
+        if self.packed:
+            pack_tree(repo_root)
+        self.hub.reindex()
+        self.timed("incremental_update", lambda: dict(self.sync(), changed=changed))
+        self.cleanup(orphans)
+        self.timed("verify_quick", lambda: self.verify(False))
+        self.timed("verify_full", lambda: self.verify(True))
+        if speed_test_seconds:
+            url = f"{self.endpoint}/{SPEED_TEST_REPO_ID}/resolve/main/{SPEED_TEST_FILENAME}"
+            self.timed("speed_test", lambda: {"mbps": round(
+                hf_speedtest.measure_download_speed(False, timeout=speed_test_seconds, url=url), 2)})
+        return self.results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks install, update, cleanup and verify against a local fake hub.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"results file (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--inis", type=int, default=500, help="ini files per repo folder")
+    parser.add_argument("--textures-per-ini", type=int, default=40)
+    parser.add_argument("--repo-orphans", type=int, default=50, help="unreferenced textures per repo folder")
+    parser.add_argument("--max-texture-kb", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every request")
+    parser.add_argument("--bandwidth-mbps", type=float, help="cap shared by all responses")
+    parser.add_argument("--workers", type=int, help="fixed number of download connections (default: adaptive)")
+    parser.add_argument("--update-fraction", type=float, default=0.01, help="share of textures changed for the update")
+    parser.add_argument("--install-orphans", type=int, default=5000, help="stale textures added before the cleanup")
+    parser.add_argument("--speed-test-seconds", type=float, default=5, help="0 to skip the speed test")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    parser.add_argument("--profile", metavar="PREFIX", help="write a sampling profile of each sync to PREFIX_<n>.txt")
+    parser.add_argument("--packed", action="store_true", help="pack the tree into shards and install from those")
+    parser.add_argument("--plain-textures", action="store_true",
+                        help="list textures as regular git files instead of LFS files, as a repo without LFS patterns would")
+    args = parser.parse_args(argv)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="texturepp_bench_"))
+    repo_root = work_dir / "repo"
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "keep", "profile")}
+    try:
+        started = time.perf_counter()
+        make_tree(repo_root, VARIANT_FOLDERS, args.inis, args.textures_per_ini, args.repo_orphans,
+                  (1024, args.max_texture_kb * 1024))
+        if args.packed:
+            pack_tree(repo_root)
+        hub = FakeHub(repo_root, sync.REPO_ID, args.latency_ms, args.bandwidth_mbps,
+                      lfs_suffixes=() if args.plain_textures else TEXTURE_SUFFIXES)
+        print(f"Generated {len(hub.files)} files in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        endpoint = hub.start()
+        try:
+            results = Benchmark(work_dir, hub, endpoint, args.workers, args.profile, args.packed).run(
+                repo_root, args.install_orphans, args.update_fraction, args.speed_test_seconds)
+        finally:
+            hub.stop()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "timestamp_utc": datetime.now(timezone.utc).isoformat().split('.')[0],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "repo_files": len(hub.files),
+        "results": results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
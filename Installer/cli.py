@@ -0,0 +1,158 @@
+import sys, json, time, argparse, threading
+
+import sync
+import speedtest as hf_speedtest
+from downloader import MAX_WORKERS, new_session
+from verify import load_report
+from timing import PhaseTimer
+
+ENDPOINT_CHOICES = ("auto", "hf", "mirror", "both")
+
+class EventWriter:
+    """
+    Writes one JSON object per line. Holds on to the real stdout, because
+    main points sys.stdout at stderr so the log lines sync prints with
+    print() do not end up among the events.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {"event": event, "t": round(time.monotonic() - self.started, 3), **fields}
+        with self.lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+
+def resolve_endpoint(choice, events):
+    """Returns (use_mirror, use_both) for an --endpoint choice; 'auto' and 'both' race the endpoints first."""
+    if choice == "hf":
+        return False, False
+    if choice == "mirror":
+        return True, False
+    results = hf_speedtest.probe_endpoints()
+    use_mirror = hf_speedtest.choose_mirror(results)
+    events.emit("endpoint_probe", results=results, use_mirror=use_mirror)
+    return use_mirror, choice == "both"
+
+def measure_speed(use_mirror, events):
+    try:
+        speed = hf_speedtest.measure_download_speed(use_mirror=use_mirror)
+    except Exception as e:
+        events.emit("speedtest", error=str(e))
+        return None
+    events.emit("speedtest", mbps=round(speed, 2))
+    return speed
+
+def run_targets(args, events):
+    if args.variant not in sync.VARIANT_MAP:
+        events.emit("error", message=f"Unknown variant '{args.variant}'.")
+        return False
+    if args.variant == "Advanced":
+        if not args.components:
+            events.emit("error", message="The Advanced variant needs --components.")
+            return False
+        sync.VARIANT_MAP["Advanced"]["repo_folders"] = args.components
+
+    use_mirror, use_both = resolve_endpoint(args.endpoint, events)
+    speed = args.speed_mbps if args.speed_mbps is not None else measure_speed(use_mirror, events)
+    revision = None
+    if args.command == "install":
+        try:
+            revision = sync.get_remote_revision(use_mirror)
+        except Exception:
+            pass
+
+    # One connection pool and one listing cache for every target, so later targets reuse warm
+    # connections and list each repo folder only once
+    session = new_session(args.workers or MAX_WORKERS)
+    listings = {}
+    all_ok = True
+    try:
+        for mods_folder in args.mods_folder:
+            target = {"mods_folder": mods_folder, "variant": args.variant}
+            events.emit("start", **target)
+            started = time.monotonic()
+            timer = PhaseTimer()
+            common = dict(
+                status_callback=lambda message: events.emit("status", message=message, **target),
+                progress_callback=lambda progress: events.emit("progress", **progress, **target),
+                download_speed_mbps=speed, max_workers=args.workers, bandwidth_cap_mbps=args.bandwidth_cap,
+                use_both_endpoints=use_both, session=session, listings=listings
+            )
+            try:
+                if args.command == "install":
+                    success, message = sync.sync_repo(mods_folder, args.variant, use_mirror, remote_revision=revision,
+                                                      telemetry=not args.no_telemetry, timer=timer,
+                                                      profile_path=args.profile, packed=not args.no_packed, xet=not args.no_xet,
+                                                      migrate=args.switch, **common)
+                    report = None
+                else:
+                    success, message = sync.verify_repo(mods_folder, args.variant, use_mirror,
+                                                        repair=not args.no_repair, full=args.full, **common)
+                    report = load_report(sync.get_install_dir(mods_folder, args.variant))
+            except Exception as e:
+                success, message, report = False, f"A critical error occurred: {e}", None
+            all_ok = all_ok and success
+            events.emit("done", success=success, message=message, elapsed_s=round(time.monotonic() - started, 3),
+                        timings=timer.spans, **({"report": report} if report else {}), **target)
+    finally:
+        session.close()
+    return all_ok
+
+def run_speedtest(args, events):
+    use_mirror, _ = resolve_endpoint(args.endpoint, events)
+    return measure_speed(use_mirror, events) is not None
+
+def positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("must be a positive number")
+    return number
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Texture++ installer without the GUI. Progress is printed as JSON lines.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    endpoint_args = argparse.ArgumentParser(add_help=False)
+    endpoint_args.add_argument("--endpoint", choices=ENDPOINT_CHOICES, default="auto",
+                               help="hf, mirror, both, or auto to pick the faster one (default: auto)")
+
+    target_args = argparse.ArgumentParser(add_help=False, parents=[endpoint_args])
+    target_args.add_argument("--variant", required=True, help=f"one of: {', '.join(sync.VARIANT_MAP)}")
+    target_args.add_argument("--mods-folder", required=True, action="append",
+                             help="Mods folder to install into; repeat for several targets")
+    target_args.add_argument("--components", nargs="+", help="repo folders for the Advanced variant")
+    target_args.add_argument("--workers", type=int, help="fixed number of download connections (default: adaptive)")
+    target_args.add_argument("--bandwidth-cap", type=positive_float, help="speed limit in Mbps")
+    target_args.add_argument("--speed-mbps", type=positive_float, help="skip the speed test and assume this link speed")
+
+    install = subparsers.add_parser("install", parents=[target_args], help="install or update")
+    install.add_argument("--no-telemetry", action="store_true", help="do not collect or upload the install log")
+    install.add_argument("--profile", metavar="PATH", help="write a sampling profile of each install to PATH")
+    install.add_argument("--no-packed", action="store_true", help="download file by file even where packed shards exist")
+    install.add_argument("--no-xet", action="store_true", help="download whole files instead of xet chunks")
+    install.add_argument("--switch", action="store_true",
+                         help="replace an installed variant that shares folders with this one instead of keeping both")
+    verify = subparsers.add_parser("verify", parents=[target_args], help="check an install and repair it")
+    verify.add_argument("--full", action="store_true", help="hash every file, even unchanged ones")
+    verify.add_argument("--no-repair", action="store_true", help="only report missing or corrupted files")
+    subparsers.add_parser("speedtest", parents=[endpoint_args], help="probe the endpoints and measure download speed")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    events = EventWriter(sys.stdout)
+    sys.stdout = sys.stderr # Plain log lines go to stderr so stdout stays valid JSON lines
+    if args.command == "speedtest":
+        ok = run_speedtest(args, events)
+    else:
+        ok = run_targets(args, events)
+    if args.command == "install" and not args.no_telemetry:
+        from telemetry import wait_for_uploads
+        wait_for_uploads()
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
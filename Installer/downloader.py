@@ -0,0 +1,453 @@
+import os, time, hashlib, threading
+from collections import deque
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+
+from manifest import new_hasher
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 3
+DEFAULT_WORKERS = 8
+MIN_WORKERS = 2
+MAX_WORKERS = 32
+WORKER_STEP = 2
+ADJUST_INTERVAL = 3.0
+REQUEST_TIMEOUT = (10, 20) # Connect and read timeouts; a stalled transfer fails over to another endpoint
+ENDPOINT_MAX_COOLDOWN = 60
+RATE_SAMPLE_MIN_BYTES = 256 * 1024
+PROGRESS_INTERVAL = 1.0
+DEFAULT_RTT_MS = 150
+STOP_GRACE = 1.0 # Seconds workers get to finish their current chunk after a stop
+RATE_WINDOW = 5.0
+MONITOR_INTERVAL = 0.5
+
+class DownloadError(Exception):
+    pass
+
+class DownloadCancelled(Exception):
+    pass
+
+class TransferStats:
+    """Aggregate byte and file counters shared by all workers of a scheduler."""
+    def __init__(self, total_files=0, total_bytes=0):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.total_files, self.total_bytes = total_files, total_bytes
+        self.files_done, self.bytes_done = 0, 0
+        self.workers = None
+        self.samples = deque([(self.started, 0)])
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes_done += count
+
+    def add_file(self, count=1):
+        with self.lock:
+            self.files_done += count
+
+    def throughput_mbps(self):
+        elapsed = time.monotonic() - self.started
+        return self.bytes_done * 8 / elapsed / 1_000_000 if elapsed > 0 else 0.0
+
+    def sample(self):
+        """Records a (time, bytes) point for the rolling rate; called periodically by the scheduler."""
+        now = time.monotonic()
+        with self.lock:
+            self.samples.append((now, self.bytes_done))
+            while len(self.samples) > 2 and self.samples[1][0] <= now - RATE_WINDOW:
+                self.samples.popleft()
+
+    def current_mbps(self):
+        """Throughput over the last few seconds, which follows changes faster than the run average."""
+        (first_time, first_bytes), (last_time, last_bytes) = self.samples[0], self.samples[-1]
+        if last_time - first_time <= 0:
+            return self.throughput_mbps()
+        return (last_bytes - first_bytes) * 8 / (last_time - first_time) / 1_000_000
+
+    def eta_seconds(self):
+        rate = self.current_mbps() * 1_000_000 / 8
+        return (self.total_bytes - self.bytes_done) / rate if rate > 0 else None
+
+    def snapshot(self):
+        """Current counters as a plain dict, for progress events."""
+        with self.lock:
+            eta = self.eta_seconds()
+            return {"files_done": self.files_done, "total_files": self.total_files,
+                    "bytes_done": self.bytes_done, "total_bytes": self.total_bytes,
+                    "mbps": round(self.current_mbps(), 2), "average_mbps": round(self.throughput_mbps(), 2),
+                    "eta_s": round(eta) if eta is not None else None, "workers": self.workers}
+
+def initial_tuning(download_speed_mbps):
+    """
+    Picks a starting (worker count, chunk size) from the speed test result.
+    Fast links need more parallel connections to fill the pipe and larger
+    chunks to keep per-chunk overhead low; slow links do better with a few
+    connections and small chunks.
+    """
+    if not download_speed_mbps or download_speed_mbps <= 0:
+        return DEFAULT_WORKERS, CHUNK_SIZE
+    workers = max(MIN_WORKERS + 2, min(MAX_WORKERS, round(download_speed_mbps / 25)))
+    if download_speed_mbps >= 500:
+        chunk_size = 4 * 1024 * 1024
+    elif download_speed_mbps >= 100:
+        chunk_size = 1024 * 1024
+    else:
+        chunk_size = 256 * 1024
+    return workers, chunk_size
+
+def estimate_seconds(total_bytes, file_count, download_speed_mbps, rtt_ms=None):
+    """
+    Expected download time for a set of files: the bytes at the measured
+    speed, plus one round trip per file spread over the connections the
+    scheduler would start with.
+    """
+    workers, _ = initial_tuning(download_speed_mbps)
+    transfer = total_bytes * 8 / (download_speed_mbps * 1_000_000)
+    return transfer + file_count * (rtt_ms or DEFAULT_RTT_MS) / 1000 / workers
+
+class RateLimiter:
+    """Token bucket shared by all workers to keep total throughput under a cap."""
+    def __init__(self, limit_mbps):
+        self.rate = limit_mbps * 1_000_000 / 8
+        self.capacity = self.rate / 4
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+class ConcurrencyController:
+    """
+    Adjusts the number of active workers from live throughput. It keeps
+    stepping in one direction while throughput improves and reverses when a
+    step made it worse; failed requests halve the worker count.
+    """
+    def __init__(self, initial, minimum=MIN_WORKERS, maximum=MAX_WORKERS, interval=ADJUST_INTERVAL):
+        self.minimum, self.maximum, self.interval = minimum, max(minimum, maximum), interval
+        self.limit = max(self.minimum, min(self.maximum, initial))
+        self.direction = 1
+        self.last_time, self.last_bytes, self.last_rate = time.monotonic(), 0, None
+
+    def update(self, bytes_done):
+        now = time.monotonic()
+        if now - self.last_time < self.interval:
+            return
+        rate = (bytes_done - self.last_bytes) / (now - self.last_time)
+        if self.last_rate is not None and rate < self.last_rate * 0.95:
+            self.direction = -self.direction
+        self.limit = max(self.minimum, min(self.maximum, self.limit + self.direction * WORKER_STEP))
+        self.last_time, self.last_bytes, self.last_rate = now, bytes_done, rate
+
+    def start_window(self):
+        self.last_time, self.last_bytes = time.monotonic(), 0
+
+    def on_error(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.direction = 1
+        self.last_rate = None
+
+def new_session(max_workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class EndpointPool:
+    """
+    Tracks live throughput and failures for each endpoint and hands out the
+    one with the most spare capacity, so a faster host gets proportionally
+    more files. An endpoint that errors or stalls is benched for a growing
+    cool-down and its work shifts to the others.
+    """
+    def __init__(self, endpoints):
+        self.lock = threading.Lock()
+        self.state = {
+            endpoint: {"active": 0, "rate": None, "failures": 0, "benched_until": 0.0, "bytes": 0}
+            for endpoint in endpoints
+        }
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            healthy = [e for e, state in self.state.items() if state["benched_until"] <= now] or list(self.state)
+            known_rates = [state["rate"] for state in self.state.values() if state["rate"]]
+            default_rate = max(known_rates) if known_rates else 1.0
+
+            def load(endpoint):
+                state = self.state[endpoint]
+                return (state["active"] + 1) / (state["rate"] or default_rate)
+
+            endpoint = min(healthy, key=load)
+            self.state[endpoint]["active"] += 1
+            return endpoint
+
+    def release(self, endpoint, size=0, seconds=0.0, failed=False):
+        with self.lock:
+            state = self.state[endpoint]
+            state["active"] -= 1
+            if failed:
+                state["failures"] += 1
+                state["benched_until"] = time.monotonic() + min(ENDPOINT_MAX_COOLDOWN, 5 * 2 ** (state["failures"] - 1))
+                return
+            state["failures"] = 0
+            state["bytes"] += size
+            if seconds > 0 and size >= RATE_SAMPLE_MIN_BYTES:
+                rate = size / seconds
+                state["rate"] = rate if state["rate"] is None else 0.7 * state["rate"] + 0.3 * rate
+
+    def healthy_count(self):
+        with self.lock:
+            now = time.monotonic()
+            return sum(1 for state in self.state.values() if state["benched_until"] <= now)
+
+    def summary(self):
+        """Bytes served and failure count per endpoint, for logs and telemetry."""
+        with self.lock:
+            return {endpoint: {"bytes": state["bytes"], "failures": state["failures"]}
+                    for endpoint, state in self.state.items()}
+
+def job_files(entry):
+    """Files a job installs: one, or every member of a shard range."""
+    return len(entry["members"]) if "members" in entry else 1
+
+def partial_path(tmp_dir, dest, entry):
+    """Partial download of one version of a file; a new version never resumes an old one's bytes."""
+    key = f"{dest}:{entry['oid']}"
+    return tmp_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.part"
+
+def resume_partial(path, hasher, size):
+    """Feeds an existing partial file into hasher and returns its length, or 0 if there is nothing usable."""
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > size:
+                raise ValueError
+            resumed = 0
+            while chunk := f.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                resumed += len(chunk)
+            return resumed
+    except OSError:
+        return 0
+    except ValueError:
+        path.unlink(missing_ok=True)
+        return 0
+
+def download_file(session, url, headers, dest, entry, tmp_dir, on_bytes=None,
+                  chunk_size=CHUNK_SIZE, rate_limiter=None, stop_event=None):
+    """
+    Streams a single file into a partial file in tmp_dir, checks its size and
+    hash against the remote entry, then moves it into place. A partial file
+    left by an interrupted attempt is resumed with a Range request. The stop
+    event is checked between chunks.
+
+    On failure the partial file is kept for the next attempt, unless it failed
+    verification, the bytes are taken back from on_bytes and the error is raised.
+    """
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    part_path = partial_path(tmp_dir, dest, entry)
+    hasher = new_hasher(entry)
+    resumed = resume_partial(part_path, hasher, entry["size"])
+    received = 0
+    if on_bytes and resumed:
+        on_bytes(resumed)
+    try:
+        if resumed < entry["size"]:
+            request_headers = dict(headers, Range=f"bytes={resumed}-") if resumed else headers
+            with session.get(url, headers=request_headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                if resumed and response.status_code != 206:
+                    # The server ignored the range and sends the whole file
+                    if on_bytes:
+                        on_bytes(-resumed)
+                    hasher, resumed = new_hasher(entry), 0
+                with open(part_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size):
+                        if stop_event and stop_event.is_set():
+                            raise DownloadCancelled()
+                        if rate_limiter:
+                            rate_limiter.consume(len(chunk))
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        received += len(chunk)
+                        if on_bytes:
+                            on_bytes(len(chunk))
+        if resumed + received != entry["size"] or hasher.hexdigest() != entry["oid"]:
+            part_path.unlink(missing_ok=True)
+            raise DownloadError(f"Verification failed for '{dest.name}'")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part_path, dest)
+    except BaseException:
+        if on_bytes:
+            on_bytes(-(resumed + received))
+        raise
+
+class DownloadScheduler:
+    """
+    Runs download jobs from every repo folder off one shared queue on a bounded
+    pool of worker threads. The queue is ordered by size; half of the workers
+    take the largest remaining file and the other half the smallest, so big
+    textures start early and small files keep the remaining connections busy.
+
+    The starting worker count and chunk size come from the measured link
+    speed; the number of active workers is then tuned from live throughput
+    unless max_workers fixes it, and an optional bandwidth cap is shared by
+    all workers.
+
+    With several endpoints, each request goes to the endpoint with the most
+    spare capacity and failed attempts are retried on another one. Every file
+    is checked against the same expected hash whichever host served it.
+
+    Jobs whose entry lists "members" are byte ranges of a packed shard and
+    are handed to fetch_range, which has the same interface as download_file.
+    """
+    def __init__(self, endpoints, url_for, headers, tmp_dir, download_speed_mbps=None, max_workers=None,
+                 bandwidth_cap_mbps=None, session=None, on_file_done=None, on_progress=None,
+                 progress_interval=PROGRESS_INTERVAL, on_event=None, stop_event=None, fetch_range=None):
+        self.endpoints = EndpointPool(endpoints)
+        self.url_for = url_for
+        self.max_attempts = max(MAX_RETRIES, 2 * len(endpoints))
+        self.headers = headers
+        self.tmp_dir = Path(tmp_dir)
+        initial_workers, self.chunk_size = initial_tuning(download_speed_mbps)
+        if max_workers:
+            # A given worker count is held fixed so runs (e.g. benchmarks) are reproducible
+            self.controller = ConcurrencyController(max_workers, minimum=max_workers, maximum=max_workers)
+        else:
+            self.controller = ConcurrencyController(initial_workers)
+        self.rate_limiter = RateLimiter(bandwidth_cap_mbps) if bandwidth_cap_mbps else None
+        self.session = session
+        self.on_file_done = on_file_done
+        self.on_progress = on_progress
+        self.on_event = on_event
+        self.stop_event = stop_event or threading.Event()
+        self.fetch_range = fetch_range
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.ordered = False
+        self.stats = None
+        self.error = None
+        self.last_report = 0.0
+
+    def next_job(self, index):
+        while True:
+            with self.lock:
+                if self.error or not self.queue or self.stop_event.is_set():
+                    return None
+                if index < self.controller.limit:
+                    return self.queue.popleft() if self.ordered or index % 2 == 0 else self.queue.pop()
+            time.sleep(MONITOR_INTERVAL)
+
+    def report_progress(self, force=False):
+        now = time.monotonic()
+        if not self.on_progress or (not force and now - self.last_report < self.progress_interval):
+            return
+        self.last_report = now
+        self.on_progress(self.stats)
+
+    def emit(self, event):
+        if self.on_event:
+            self.on_event(event)
+
+    def download_job(self, session, path, dest, entry):
+        """Downloads one file or shard range, failing over between endpoints. Returns (attempts, endpoint)."""
+        fetch = self.fetch_range if "members" in entry else download_file
+        for attempt in range(1, self.max_attempts + 1):
+            endpoint = self.endpoints.acquire()
+            started = time.monotonic()
+            try:
+                fetch(session, self.url_for(endpoint, path), self.headers, Path(dest), entry, self.tmp_dir,
+                              self.stats.add_bytes, self.chunk_size, self.rate_limiter, self.stop_event)
+            except (requests.RequestException, OSError, DownloadError) as e:
+                self.endpoints.release(endpoint, failed=True)
+                self.emit({"event": "retry" if attempt < self.max_attempts else "failed", "path": path,
+                           "endpoint": endpoint, "attempt": attempt, "error": str(e)[:200]})
+                if attempt == self.max_attempts:
+                    raise
+                # Only back off concurrency when there is no healthy endpoint left to fail over to
+                if not self.endpoints.healthy_count():
+                    self.controller.on_error()
+                if self.stop_event.wait(min(attempt, 5)):
+                    raise DownloadCancelled()
+            else:
+                self.endpoints.release(endpoint, entry["size"], time.monotonic() - started)
+                return attempt, endpoint
+
+    def worker(self, session, index):
+        while (job := self.next_job(index)) is not None:
+            path, dest, entry = job
+            started = time.monotonic()
+            try:
+                attempts, endpoint = self.download_job(session, path, dest, entry)
+            except Exception as e:
+                with self.lock:
+                    self.error = self.error or e
+                return
+            self.stats.add_file(job_files(entry))
+            self.emit({"event": "range" if "members" in entry else "file", "path": path, "bytes": entry["size"],
+                       "files": job_files(entry), "attempts": attempts,
+                       "endpoint": endpoint, "seconds": round(time.monotonic() - started, 3)})
+            if self.on_file_done:
+                self.on_file_done(path, entry)
+
+    def run(self, jobs, ordered=False):
+        """
+        Downloads (path, dest, entry) jobs and returns the TransferStats.
+        With ordered set, jobs start in the given order instead of by size.
+        The first failure stops the remaining workers and is re-raised;
+        setting the stop event raises DownloadCancelled within STOP_GRACE.
+        """
+        if not ordered:
+            jobs = sorted(jobs, key=lambda job: job[2]["size"], reverse=True)
+        self.queue, self.ordered = deque(jobs), ordered
+        self.stats = TransferStats(sum(job_files(job[2]) for job in jobs), sum(job[2]["size"] for job in jobs))
+        self.stats.workers = self.controller.limit
+        self.controller.start_window()
+        self.error = None
+        if not jobs:
+            return self.stats
+
+        pool_size = min(self.controller.maximum, len(jobs))
+        session = self.session or new_session(pool_size)
+        try:
+            # Workers are named after the calling thread so thread-scoped log capture includes them
+            parent = threading.current_thread().name
+            threads = [threading.Thread(target=self.worker, args=(session, i), name=f"{parent}/worker-{i}", daemon=True)
+                       for i in range(pool_size)]
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                if self.stop_event.is_set():
+                    with self.lock:
+                        self.error = self.error or DownloadCancelled()
+                    # Workers stop at their next chunk; one stuck on a slow read is left behind (it is a daemon)
+                    deadline = time.monotonic() + STOP_GRACE
+                    for thread in threads:
+                        thread.join(max(0, deadline - time.monotonic()))
+                    break
+                alive = next((thread for thread in threads if thread.is_alive()), None)
+                if alive:
+                    alive.join(MONITOR_INTERVAL)
+                with self.lock:
+                    self.controller.update(self.stats.bytes_done)
+                    self.stats.workers = self.controller.limit
+                self.stats.sample()
+                self.report_progress()
+        finally:
+            if self.session is None:
+                session.close()
+        if self.error:
+            raise self.error
+        self.stats.sample()
+        self.report_progress(force=True)
+        return self.stats
@@ -0,0 +1,209 @@
+import os, json, random, hashlib, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import unquote, urlparse, parse_qs
+
+from downloader import RateLimiter
+from ini_index import TEXTURE_SUFFIXES
+from speedtest import SPEED_TEST_REPO_ID, SPEED_TEST_FILENAME
+
+PAGE_SIZE = 1000
+SEND_CHUNK_SIZE = 64 * 1024
+SPEED_TEST_SIZE = 1024**3
+LFS_SIZE_THRESHOLD = 10 * 1024**2 # The hub stores larger files in LFS whatever .gitattributes says
+
+def git_oid(path, lfs_suffixes=TEXTURE_SUFFIXES):
+    """
+    Returns (oid, is_lfs, size) the way the hub reports them: sha256 for LFS
+    files, git blob sha1 otherwise. Files with one of lfs_suffixes (standing
+    in for the .gitattributes patterns) and large files are in LFS.
+    """
+    data = Path(path).read_bytes()
+    if Path(path).suffix.lower() in lfs_suffixes or len(data) >= LFS_SIZE_THRESHOLD:
+        return hashlib.sha256(data).hexdigest(), True, len(data)
+    hasher = hashlib.sha1(b"blob %d\0" % len(data))
+    hasher.update(data)
+    return hasher.hexdigest(), False, len(data)
+
+class FakeHub:
+    """
+    A local stand-in for the parts of the hub the installer talks to:
+    dataset info, the paginated tree listing, and file resolve with Range
+    support, plus a virtual speed test file. Every request can be delayed
+    by a fixed latency and all responses share an optional bandwidth cap.
+    A tree packed with shards.pack_folder is served as the packed layout.
+    lfs_suffixes decides which smaller files are listed as LFS files.
+    """
+    def __init__(self, root, repo_id, latency_ms=0, bandwidth_mbps=None, lfs_suffixes=TEXTURE_SUFFIXES):
+        self.root, self.repo_id = Path(root), repo_id
+        self.lfs_suffixes = tuple(lfs_suffixes)
+        self.latency = latency_ms / 1000
+        self.rate_limiter = RateLimiter(bandwidth_mbps) if bandwidth_mbps else None
+        self.lock = threading.Lock()
+        self.requests, self.bytes_sent = 0, 0
+        self.server = None
+        self.reindex()
+
+    def reindex(self):
+        """Re-reads the tree after it was changed on disk; the revision changes with the content."""
+        self.files = {path.relative_to(self.root).as_posix(): git_oid(path, self.lfs_suffixes)
+                      for path in sorted(self.root.rglob('*')) if path.is_file()}
+        self.revision = hashlib.sha1(json.dumps(self.files, sort_keys=True).encode()).hexdigest()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests, self.bytes_sent = 0, 0
+
+    def counters(self):
+        with self.lock:
+            return {"requests": self.requests, "bytes_sent": self.bytes_sent}
+
+    def count(self, requests=0, sent=0):
+        with self.lock:
+            self.requests += requests
+            self.bytes_sent += sent
+
+    def tree_items(self, prefix):
+        prefix = prefix.strip('/')
+        items = []
+        for path, (oid, lfs, size) in self.files.items():
+            if prefix and not path.startswith(prefix + '/'):
+                continue
+            item = {"type": "file", "path": path, "size": size, "oid": oid}
+            if lfs:
+                item["oid"] = hashlib.sha1(oid.encode()).hexdigest()
+                item["lfs"] = {"oid": oid, "size": size, "pointerSize": 130}
+            items.append(item)
+        return items
+
+    def start(self, port=0):
+        """Serves in a background thread. Returns the base URL to use as an endpoint."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def make_handler(hub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True # Headers and body go out in separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, obj, headers=None):
+            body = json.dumps(obj).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_not_found(self):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def send_file(self, read, size, etag, head):
+            start, end, status = 0, size - 1, 200
+            byte_range = self.headers.get("Range", "")
+            if byte_range.startswith("bytes="):
+                first, _, last = byte_range[6:].partition('-')
+                start, end, status = int(first or 0), min(int(last or size - 1), size - 1), 206
+            self.send_response(status)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("ETag", f'"{etag}"')
+            self.send_header("X-Repo-Commit", hub.revision)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if head:
+                return
+            for offset in range(start, end + 1, SEND_CHUNK_SIZE):
+                piece = read(offset, min(SEND_CHUNK_SIZE, end + 1 - offset))
+                if hub.rate_limiter:
+                    hub.rate_limiter.consume(len(piece))
+                try:
+                    self.wfile.write(piece)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                hub.count(sent=len(piece))
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head=False):
+            hub.count(requests=1)
+            if hub.latency:
+                time.sleep(hub.latency)
+            url = urlparse(self.path)
+            path, query = unquote(url.path), parse_qs(url.query)
+            api = f"/api/datasets/{hub.repo_id}"
+            resolve = f"/datasets/{hub.repo_id}/resolve/"
+            speed_test = f"/{SPEED_TEST_REPO_ID}/resolve/main/{SPEED_TEST_FILENAME}"
+
+            if path == api or path.startswith(api + "/revision/"):
+                return self.send_json({"id": hub.repo_id, "sha": hub.revision})
+            if path.startswith(api + "/tree/"):
+                _, _, prefix = path[len(api + "/tree/"):].partition('/')
+                items = hub.tree_items(prefix)
+                cursor = int(query.get("cursor", ["0"])[0])
+                headers = {}
+                if cursor + PAGE_SIZE < len(items):
+                    headers["Link"] = (f'<http://{self.headers["Host"]}{url.path}?recursive=True'
+                                       f'&cursor={cursor + PAGE_SIZE}>; rel="next"')
+                return self.send_json(items[cursor:cursor + PAGE_SIZE], headers)
+            if path.startswith(resolve):
+                _, _, file_path = path[len(resolve):].partition('/')
+                if file_path not in hub.files:
+                    return self.send_not_found()
+                oid, _, size = hub.files[file_path]
+                # Read from disk per piece so range requests into large shards stay cheap
+                with open(hub.root / file_path, 'rb') as f:
+                    def read(offset, count):
+                        f.seek(offset)
+                        return f.read(count)
+                    return self.send_file(read, size, oid, head)
+            if path == speed_test:
+                return self.send_file(lambda offset, count: bytes(count), SPEED_TEST_SIZE, "speedtest", head)
+            self.send_not_found()
+
+    return Handler
+
+def make_tree(root, folders=("Base_4X", "Core_2X"), inis_per_folder=100, textures_per_ini=20,
+              orphans_per_folder=10, texture_size=(4 * 1024, 64 * 1024), seed=0):
+    """
+    Writes a synthetic repo tree shaped like the real one: each folder holds
+    one directory per character with an ini file and the textures it
+    references, plus some textures no ini file references.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    for folder_name in folders:
+        for i in range(inis_per_folder):
+            directory = root / folder_name / f"char{i:05d}"
+            directory.mkdir(parents=True, exist_ok=True)
+            sections = []
+            for t in range(textures_per_ini):
+                name = f"{folder_name}_{i:05d}_{t:03d}.dds"
+                (directory / name).write_bytes(rng.randbytes(rng.randint(*texture_size)))
+                sections.append(f"[TextureOverride{t}]\nfilename = {name}\n")
+            (directory / f"char{i:05d}.ini").write_text("\n".join(sections))
+        for o in range(orphans_per_folder):
+            (root / folder_name / f"orphan_{o:03d}.png").write_bytes(rng.randbytes(texture_size[0]))
+
+def touch_tree(root, fraction=0.01, seed=1):
+    """Rewrites a fraction of the textures in place, as an incremental update would. Returns how many."""
+    rng = random.Random(seed)
+    textures = sorted(path for path in Path(root).rglob('*.dds'))
+    changed = rng.sample(textures, max(1, int(len(textures) * fraction)))
+    for path in changed:
+        path.write_bytes(rng.randbytes(os.path.getsize(path)))
+    return len(changed)
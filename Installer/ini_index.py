@@ -0,0 +1,121 @@
+import os, re, json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import STATE_DIR, write_json_atomic
+
+INDEX_FILENAME = "ini_index.json"
+INDEX_VERSION = 1
+TEXTURE_SUFFIXES = ('.png', '.dds')
+FILENAME_PATTERN = re.compile(r'^filename\s*=\s*(.+)$', re.IGNORECASE)
+WORKERS = 8
+DELETE_BATCH_SIZE = 256
+
+def index_path(install_dir):
+    return Path(install_dir) / STATE_DIR / INDEX_FILENAME
+
+def load_index(install_dir):
+    try:
+        with open(index_path(install_dir), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_VERSION, "inis": {}}
+
+def save_index(install_dir, index):
+    write_json_atomic(index_path(install_dir), index)
+
+def scan_install(install_dir):
+    """
+    Walks the install once and returns ({ini path: mtime_ns}, [texture paths]),
+    both relative to install_dir in posix form. Dot-directories such as the
+    installer state folder are skipped.
+    """
+    ini_files, texture_files = {}, []
+    pending = [(str(install_dir), "")]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            rel_path = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    pending.append((entry.path, rel_path + "/"))
+                continue
+            suffix = os.path.splitext(entry.name)[1].lower()
+            if suffix == '.ini':
+                ini_files[rel_path] = entry.stat().st_mtime_ns
+            elif suffix in TEXTURE_SUFFIXES:
+                texture_files.append(rel_path)
+    return ini_files, texture_files
+
+def is_texture(path):
+    return os.path.splitext(path)[1].lower() in TEXTURE_SUFFIXES
+
+def texture_name(path):
+    return path.rsplit('/', 1)[-1]
+
+def parse_ini(path):
+    """Returns the texture file names referenced by 'filename =' lines in an ini file."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return sorted({match.group(1).strip() for line in f if (match := FILENAME_PATTERN.match(line.strip()))})
+
+def update_index(install_dir, ini_files=None, sources=None):
+    """
+    Brings the on-disk index up to date with the ini files in the install.
+    Only ini files whose mtime changed since the last run are parsed, in
+    parallel. Returns the index; pass ini_files from scan_install to avoid a
+    second traversal. sources maps ini paths to the file to read instead of
+    the installed one, such as a staged update.
+    """
+    sources = sources or {}
+    install_dir = Path(install_dir)
+    if ini_files is None:
+        ini_files, _ = scan_install(install_dir)
+    index = load_index(install_dir)
+    cached = index["inis"]
+    stale = [path for path, mtime_ns in ini_files.items()
+             if cached.get(path, {}).get("mtime_ns") != mtime_ns]
+
+    def parse(path):
+        try:
+            return path, parse_ini(sources.get(path, install_dir / path))
+        except OSError:
+            return path, []
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        parsed = dict(executor.map(parse, stale))
+
+    index["inis"] = {
+        path: {"mtime_ns": mtime_ns, "textures": parsed[path]} if path in parsed else cached[path]
+        for path, mtime_ns in ini_files.items()
+    }
+    if stale or len(cached) != len(index["inis"]):
+        save_index(install_dir, index)
+    return index
+
+def referenced_textures(index):
+    """Set of texture file names referenced by any ini file in the index."""
+    return {name for ini in index["inis"].values() for name in ini["textures"]}
+
+def remove_orphans(install_dir, texture_files, referenced):
+    """
+    Deletes textures whose file name is not referenced by any ini file,
+    in parallel batches. Returns the relative paths that were removed.
+    """
+    install_dir = Path(install_dir)
+    orphans = [path for path in texture_files if texture_name(path) not in referenced]
+
+    def unlink_batch(batch):
+        for path in batch:
+            (install_dir / path).unlink(missing_ok=True)
+
+    batches = [orphans[i:i + DELETE_BATCH_SIZE] for i in range(0, len(orphans), DELETE_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        list(executor.map(unlink_batch, batches))
+    return orphans
@@ -0,0 +1,93 @@
+import time, logging, threading
+from collections import deque, Counter
+
+HEAD_LINES = 100
+TAIL_LINES = 300
+HEAD_EVENTS = 50
+TAIL_EVENTS = 200
+CAPTURED_LOGGERS = ("huggingface_hub", "urllib3", "requests")
+
+class BoundedLog:
+    """Keeps the first head and the last tail items appended and counts the ones in between."""
+    def __init__(self, head, tail):
+        self.head, self.head_size = [], head
+        self.tail = deque(maxlen=tail)
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def append(self, item):
+        with self.lock:
+            if len(self.head) < self.head_size:
+                self.head.append(item)
+                return
+            if len(self.tail) == self.tail.maxlen:
+                self.dropped += 1
+            self.tail.append(item)
+
+    def items(self, marker=None):
+        """All kept items in order; marker(dropped) stands in for the omitted ones."""
+        with self.lock:
+            gap = [marker(self.dropped)] if self.dropped and marker else []
+            return self.head + gap + list(self.tail)
+
+class LogCapture(logging.Handler):
+    """
+    Bounded capture of one sync run. Raw output lines (status messages and
+    library log records) and structured events (per file: bytes, duration,
+    attempts) only keep their first and last entries, while per-event totals
+    cover the whole run, so memory and the telemetry payload stay flat
+    however long the install takes.
+
+    Capture is scoped to the thread that created it and threads named
+    below it ("<name>/..."), such as the download workers; output from
+    other threads is not recorded. Use as a context manager to attach the
+    handler to the library loggers.
+    """
+    def __init__(self, head_lines=HEAD_LINES, tail_lines=TAIL_LINES, head_events=HEAD_EVENTS, tail_events=TAIL_EVENTS):
+        super().__init__(logging.INFO)
+        self.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        self.owner = threading.current_thread().name
+        self.started = time.monotonic()
+        self.lines = BoundedLog(head_lines, tail_lines)
+        self.events = BoundedLog(head_events, tail_events)
+        self.totals = Counter()
+        self.totals_lock = threading.Lock()
+
+    def in_scope(self, thread_name):
+        return thread_name == self.owner or thread_name.startswith(self.owner + "/")
+
+    def line(self, message):
+        self.lines.append(message)
+
+    def emit(self, record):
+        if self.in_scope(record.threadName):
+            self.lines.append(self.format(record))
+
+    def event(self, event):
+        event = {"t": round(time.monotonic() - self.started, 3), **event}
+        with self.totals_lock:
+            self.totals[f"{event['event']}_count"] += 1
+            self.totals[f"{event['event']}_bytes"] += event.get("bytes", 0)
+        self.events.append(event)
+
+    def __enter__(self):
+        for name in CAPTURED_LOGGERS:
+            logging.getLogger(name).addHandler(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name in CAPTURED_LOGGERS:
+            logging.getLogger(name).removeHandler(self)
+
+    def log_lines(self):
+        return self.lines.items(lambda dropped: f"... {dropped} lines omitted ...")
+
+    def summary(self):
+        """Structured events and their totals for the telemetry log."""
+        with self.totals_lock:
+            totals = {key: value for key, value in self.totals.items() if value}
+        return {
+            "totals": totals,
+            "omitted": self.events.dropped,
+            "events": self.events.items(lambda dropped: {"event": "omitted", "count": dropped})
+        }
@@ -2,11 +2,14 @@ import tkinter as tk, ttkbootstrap as ttk
 from tkinter import messagebox, filedialog
 import json
 from pathlib import Path
-import os, sys, math
+import os, sys, math, time
 import threading, multiprocessing
 
 import sync
+import telemetry
 import speedtest as hf_speedtest
+from progress import ProgressQueue, format_progress
+from downloader import estimate_seconds
 
 if getattr(sys, 'frozen', False):
     sys.stdout = open(os.devnull, 'w')
@@ -14,6 +17,16 @@ if getattr(sys, 'frozen', False):
 
 ICON_PATH = Path(__file__).parent / "Icon.ico"
 CONFIG_FILE = Path(sys.executable).parent / "config.json"
+ENDPOINT_PROBE_TTL = 24 * 3600 # Seconds before a cached endpoint choice is re-validated
+PROGRESS_REFRESH_MS = 250 # How often the progress screen drains the sync thread's events
+CLOSE_TIMEOUT = 5 # Seconds to wait on close for the sync to stop and save its progress
+
+def format_estimate(total_seconds):
+    if total_seconds < 60:
+        return f"{round(total_seconds)} seconds"
+    if total_seconds < 3600:
+        return f"{round(total_seconds/60)} minutes"
+    return f"{total_seconds/3600:.1f} hours"
 
 class UpdaterApp:
     def __init__(self, root):
@@ -27,14 +40,25 @@ class UpdaterApp:
         self.selected_variant = tk.StringVar(value="Core")
         self.mods_folder_path = tk.StringVar()
         self.use_mirror = tk.BooleanVar(value=False)
+        self.use_both_endpoints = tk.BooleanVar(value=False) # Spread downloads over Hugging Face and the mirror
+        self.bandwidth_cap = tk.StringVar(value="") # Optional download limit in Mbps, blank for unlimited
         self.status_message = tk.StringVar(value="Initializing...")
+        self.progress_percent = tk.DoubleVar(value=0.0)
+        self.progress_detail = tk.StringVar(value="")
+        self.progress_queue = ProgressQueue()
+        self.progress_poll_id = None
         self.stop_event = threading.Event()
+        self.sync_thread = None
         self.display_install_path = tk.StringVar()
         self.estimated_download_time = tk.StringVar(value="")
         self.download_speed_mbps = None # To store the measured download speed
+        self.remote_revision = None # Commit SHA of the dataset, resolved at startup
         self.use_mirror_from_config = False # Flag to check if mirror setting is from config
+        self.endpoint_probe = None # Cached result of the endpoint race, stored in config
+        self.estimate_generation = 0 # Bumped per estimate request so stale results are dropped
 
         self.load_config()
+        telemetry.flush_spool_in_background() # Sends logs spooled by earlier runs if a batch is due
 
         self.selected_variant.trace_add('write', self.update_display_path)
         self.mods_folder_path.trace_add('write', self.update_display_path)
@@ -71,10 +95,18 @@ class UpdaterApp:
         try:
             use_mirror_val = self.use_mirror.get()
             if not self.use_mirror_from_config:
-                # If 'use_mirror' was not in the config file, auto-detect the best setting.
-                use_mirror_val = hf_speedtest.determine_mirror_setting()
+                # If the user has not chosen, use the cached endpoint race result. A stale
+                # result is used right away and re-validated in the background.
+                probe = self.endpoint_probe
+                if probe is None:
+                    probe = self.run_endpoint_probe()
+                elif time.time() - probe.get("checked_at", 0) > ENDPOINT_PROBE_TTL:
+                    threading.Thread(target=self.run_endpoint_probe, daemon=True).start()
+                use_mirror_val = probe["use_mirror"]
                 self.root.after(0, self.use_mirror.set, use_mirror_val)
 
+            threading.Thread(target=self.check_remote_revision, args=(use_mirror_val,), daemon=True).start()
+
             # Perform the speed test using the determined mirror setting.
             speed = hf_speedtest.measure_download_speed(use_mirror=use_mirror_val)
             self.download_speed_mbps = speed
@@ -85,6 +117,31 @@ class UpdaterApp:
             # Once the test is complete (or failed), update the UI.
             self.root.after(0, self.calculate_estimated_download_time)
 
+    def run_endpoint_probe(self):
+        """Races both endpoints and caches the faster one in the config file."""
+        results = hf_speedtest.probe_endpoints()
+        self.endpoint_probe = {
+            "use_mirror": hf_speedtest.choose_mirror(results),
+            "checked_at": time.time(),
+            "results": results
+        }
+        if not self.use_mirror_from_config:
+            self.root.after(0, self.use_mirror.set, self.endpoint_probe["use_mirror"])
+        self.root.after(0, self.save_config)
+        return self.endpoint_probe
+
+    def on_mirror_toggled(self):
+        """An explicit choice by the user overrides the automatic endpoint selection."""
+        self.use_mirror_from_config = True
+
+    def check_remote_revision(self, use_mirror):
+        """Resolves the remote revision with a single API call so up-to-date installs can skip the sync."""
+        try:
+            self.remote_revision = sync.get_remote_revision(use_mirror)
+        except Exception:
+            self.remote_revision = None
+        self.root.after(0, self.calculate_estimated_download_time)
+
     def update_window_size(self):
         """Forces the window to update its size to fit all widgets."""
         self.root.update_idletasks()
@@ -109,43 +166,97 @@ class UpdaterApp:
             self.root.after(110, self.update_window_size)
 
     def calculate_estimated_download_time(self):
-        if self.selected_variant.get() == "Advanced":
-            self.estimated_download_time.set("Estimate unavailable for Advanced.")
-            return
-        variant_details = sync.VARIANT_MAP.get(self.selected_variant.get())
+        """
+        Shows how long the selected install or update will take. The size comes
+        from the remote listing minus what is already installed; it is worked out
+        on a background thread and only the newest request updates the label.
+        """
+        variant = self.selected_variant.get()
         mods_folder = self.mods_folder_path.get()
-        if variant_details and mods_folder:
-            install_path = Path(mods_folder) / variant_details["local_dir"]
-            if install_path.exists():
-                self.estimated_download_time.set("Existing installation found. It will be updated and repaired.")
+        if variant not in sync.VARIANT_MAP or not mods_folder:
+            self.estimated_download_time.set("No variant selected or size not available.")
+            return
+        folders = sync.VARIANT_MAP[variant]["repo_folders"]
+        if variant == "Advanced":
+            selection_frame = self.frames.get(SelectionFrame)
+            folders = [opt for opt, var in selection_frame.advanced_vars.items() if var.get()] if selection_frame else []
+            if not folders:
+                self.estimated_download_time.set("Select the components to install.")
                 return
+        elif sync.is_up_to_date(mods_folder, variant, self.remote_revision):
+            self.estimated_download_time.set("Installation is up to date.")
+            return
 
-            if self.download_speed_mbps is None:
-                self.estimated_download_time.set("Measuring internet speed...")
-                return
-            if self.download_speed_mbps <= 0:
-                self.estimated_download_time.set("Cannot estimate internet speed.")
-                return
+        if self.download_speed_mbps is None:
+            self.estimated_download_time.set("Measuring internet speed...")
+            return
+        if self.download_speed_mbps <= 0:
+            self.estimated_download_time.set("Cannot estimate internet speed.")
+            return
 
-            if "size_gb" in variant_details:
-                base_seconds = variant_details["size_gb"] * 8 * 1000 / self.download_speed_mbps
-                folders = variant_details.get("repo_folders", [])
-                extra_seconds = ( 30 * ("Base_4X" in folders) + 60 * (("Core_2X" in folders) or ("Core_4X" in folders)))
-                total_seconds = base_seconds + extra_seconds
-                if total_seconds < 60:
-                    time_str = f"{round(total_seconds)} seconds"
-                elif total_seconds < 3600:
-                    time_str = f"{round(total_seconds/60)} minutes"
-                else:
-                    time_str = f"{round(total_seconds/3600)} hours"
-                self.estimated_download_time.set(f"Estimated download time: {time_str}")
+        self.estimate_generation += 1
+        self.estimated_download_time.set("Calculating download size...")
+        threading.Thread(
+            target=self.run_estimate,
+            args=(self.estimate_generation, mods_folder, variant, folders, self.use_mirror.get(), self.remote_revision,
+                  self.download_speed_mbps, self.endpoint_rtt_ms()),
+            daemon=True
+        ).start()
+
+    def run_estimate(self, generation, mods_folder, variant, folders, use_mirror, remote_revision, speed_mbps, rtt_ms):
+        try:
+            estimate = sync.estimate_download(mods_folder, variant, use_mirror, remote_revision, folders)
+        except Exception:
+            text = "Estimate unavailable: could not reach the server."
+        else:
+            if not estimate["bytes"]:
+                text = "All files are already present. Only a quick check is needed."
             else:
-                self.estimated_download_time.set("No variant selected or size not available.")
+                seconds = estimate_seconds(estimate["bytes"], estimate["files"], speed_mbps, rtt_ms)
+                text = (f"Download: {estimate['bytes'] / 1024**3:.2f} GB in {estimate['files']} files. "
+                        f"Estimated download time: {format_estimate(seconds)}")
+        self.root.after(0, self.show_estimate, generation, text)
+
+    def show_estimate(self, generation, text):
+        if generation == self.estimate_generation:
+            self.estimated_download_time.set(text)
+
+    def endpoint_rtt_ms(self):
+        """Round-trip time to the selected endpoint from the last endpoint race, if known."""
+        results = (self.endpoint_probe or {}).get("results", [])
+        return next((result["rtt_ms"] for result in results if result["use_mirror"] == self.use_mirror.get()), None)
 
     def on_closing(self):
+        """Asks a running sync to stop and closes once it has saved its progress, so the next run resumes."""
         self.stop_event.set()
+        if self.sync_thread and self.sync_thread.is_alive():
+            self.status_message.set("Stopping and saving progress...")
+            self.finish_closing(time.monotonic() + CLOSE_TIMEOUT)
+        else:
+            self.stop_progress_polling()
+            self.root.destroy()
+
+    def finish_closing(self, deadline):
+        if self.sync_thread.is_alive() and time.monotonic() < deadline:
+            self.root.after(100, self.finish_closing, deadline)
+            return
+        self.stop_progress_polling()
         self.root.destroy()
 
+    def poll_progress(self):
+        """Applies the newest queued status and progress events; runs on the Tk thread every PROGRESS_REFRESH_MS."""
+        events = self.progress_queue.drain()
+        if status := events.get("status"):
+            self.status_message.set(status["message"])
+        if progress := events.get("progress"):
+            self.frames[ProgressFrame].show_progress(progress)
+        self.progress_poll_id = self.root.after(PROGRESS_REFRESH_MS, self.poll_progress)
+
+    def stop_progress_polling(self):
+        if self.progress_poll_id is not None:
+            self.root.after_cancel(self.progress_poll_id)
+            self.progress_poll_id = None
+
     def show_frame(self, frame_class):
         frame = self.frames[frame_class]
         frame.tkraise()
@@ -170,9 +281,18 @@ class UpdaterApp:
                 else:
                     self.selected_variant.set(variant_from_config)
 
-                if 'use_mirror' in config:
+                # Configs written before the endpoint race (no 'endpoint_probe' key) saved the
+                # auto-detected value, so only newer configs mark 'use_mirror' as a user choice.
+                if 'use_mirror' in config and 'endpoint_probe' in config:
                     self.use_mirror_from_config = True
                 self.use_mirror.set(config.get("use_mirror", False))
+                if isinstance(config.get("endpoint_probe"), dict) and "use_mirror" in config["endpoint_probe"]:
+                    self.endpoint_probe = config["endpoint_probe"]
+                    if not self.use_mirror_from_config:
+                        self.use_mirror.set(self.endpoint_probe["use_mirror"])
+                self.use_both_endpoints.set(config.get("use_both_endpoints", False))
+                if config.get("bandwidth_cap_mbps"):
+                    self.bandwidth_cap.set(str(config["bandwidth_cap_mbps"]))
             except (json.JSONDecodeError, IOError):
                 self.selected_variant.set("Core")
                 self.use_mirror.set(False)
@@ -185,14 +305,27 @@ class UpdaterApp:
         config = {
             "mods_folder": self.mods_folder_path.get(),
             "variant": self.selected_variant.get(),
-            "use_mirror": self.use_mirror.get()
+            "use_both_endpoints": self.use_both_endpoints.get(),
+            "bandwidth_cap_mbps": self.get_bandwidth_cap(),
+            "endpoint_probe": self.endpoint_probe
         }
+        # Only an explicit choice is saved; otherwise the cached endpoint race decides
+        if self.use_mirror_from_config:
+            config["use_mirror"] = self.use_mirror.get()
         try:
             with open(CONFIG_FILE, 'w') as f:
                 json.dump(config, f, indent=4)
         except IOError:
             messagebox.showwarning("Config Error", "Could not save settings.")
 
+    def get_bandwidth_cap(self):
+        """Returns the speed limit in Mbps, or None when unlimited or not a positive number."""
+        try:
+            value = float(self.bandwidth_cap.get())
+            return value if value > 0 else None
+        except ValueError:
+            return None
+
     def prompt_for_folder_then_show_variants(self):
         if folder_path := filedialog.askdirectory(title="Select your main Mods folder"):
             self.mods_folder_path.set(folder_path)
@@ -204,7 +337,7 @@ class UpdaterApp:
             self.mods_folder_path.set(folder_path)
             self.save_config()
 
-    def start_process(self):
+    def start_process(self, verify=False):
         variant, mods_folder = self.selected_variant.get(), self.mods_folder_path.get()
         if not (variant and mods_folder):
             messagebox.showwarning("Incomplete", "Please select a variant and a Mods folder.")
@@ -218,32 +351,60 @@ class UpdaterApp:
                 return
             sync.VARIANT_MAP["Advanced"]["repo_folders"] = selected_components
 
+        if self.bandwidth_cap.get().strip() and self.get_bandwidth_cap() is None:
+            messagebox.showwarning("Invalid Speed Limit", "Please enter a positive number of Mbps, or leave it blank.")
+            return
+
+        migrate = False
+        if not verify and (source_variant := sync.find_migration_source(mods_folder, variant)):
+            migrate = messagebox.askyesnocancel(
+                "Switch Variant",
+                f"'{source_variant}' is already installed. Switch to '{variant}' and remove it? "
+                f"Shared files are moved over instead of downloaded.\n\nChoose No to keep both installed."
+            )
+            if migrate is None:
+                return
+
         self.save_config()
         self.show_frame(ProgressFrame)
+        self.poll_progress()
 
-        threading.Thread(
+        self.sync_thread = threading.Thread(
             target=self.run_sync_worker,
-            args=(mods_folder, variant, self.use_mirror.get(), self.stop_event),
+            args=(mods_folder, variant, self.use_mirror.get(), self.stop_event, verify, migrate),
             daemon=True
-        ).start()
+        )
+        self.sync_thread.start()
 
-    def run_sync_worker(self, mods_folder, variant, use_mirror, stop_event):
+    def run_sync_worker(self, mods_folder, variant, use_mirror, stop_event, verify=False, migrate=False):
+        # Events are queued here and applied by poll_progress on the Tk thread
+        status_callback = lambda msg: self.progress_queue.put("status", message=msg)
+        progress_callback = lambda progress: self.progress_queue.put("progress", **progress)
         try:
-            success, message = sync.sync_repo(
-                mods_folder, variant, use_mirror,
-                status_callback=lambda msg: self.root.after(0, self.status_message.set, msg),
-                stop_event=stop_event, download_speed_mbps=self.download_speed_mbps
-            )
+            if verify:
+                success, message = sync.verify_repo(
+                    mods_folder, variant, use_mirror,
+                    status_callback=status_callback, progress_callback=progress_callback,
+                    download_speed_mbps=self.download_speed_mbps, bandwidth_cap_mbps=self.get_bandwidth_cap(),
+                    use_both_endpoints=self.use_both_endpoints.get(), stop_event=stop_event
+                )
+            else:
+                success, message = sync.sync_repo(
+                    mods_folder, variant, use_mirror,
+                    status_callback=status_callback, progress_callback=progress_callback,
+                    stop_event=stop_event, download_speed_mbps=self.download_speed_mbps,
+                    remote_revision=self.remote_revision, bandwidth_cap_mbps=self.get_bandwidth_cap(),
+                    use_both_endpoints=self.use_both_endpoints.get(), migrate=migrate
+                )
         except Exception as e:
             success, message = False, f"A critical error occurred: {e}"
         finally:
+            # When stopped, on_closing is waiting for this thread and closes the window itself
             if not stop_event.is_set():
                 self.root.after(0, self.on_sync_complete, success, message)
-            else:
-                self.root.after(0, self.status_message.set, "Process interrupted by user.")
-                self.root.after(1000, self.root.destroy)
 
     def on_sync_complete(self, success, message):
+        self.stop_progress_polling()
         if success:
             messagebox.showinfo("Success", message)
         else:
@@ -264,11 +425,8 @@ class SelectionFrame(ttk.Frame):
         super().__init__(parent, padding=25)
         self.controller = controller
         variants = [
-            {"value": "Mini", "text": "Mini (~1GB)"},
-            {"value": "Base", "text": "Base (~12GB)"},
-            {"value": "Core", "text": "Core (~15GB)"},
-            {"value": "Core 4K", "text": "Core 4K (~26GB)"},
-            {"value": "Advanced", "text": "Advanced (Custom)"},
+            {"value": name, "text": f"{name} (~{details['size_gb']:g}GB)" if "size_gb" in details else f"{name} (Custom)"}
+            for name, details in sync.VARIANT_MAP.items()
         ]
 
         ttk.Label(self, text="Choose a Texture Variant", font="-size 14 -weight bold").pack(pady=(0, 15))
@@ -290,7 +448,8 @@ class SelectionFrame(ttk.Frame):
             ttk.Checkbutton(
                 self.advanced_frame,
                 text=option,
-                variable=self.advanced_vars[option]
+                variable=self.advanced_vars[option],
+                command=controller.calculate_estimated_download_time
             ).pack(anchor="w", padx=20)
             
         self.advanced_frame.pack_forget()
@@ -309,11 +468,20 @@ class SelectionFrame(ttk.Frame):
         ttk.Label(folder_display_frame, textvariable=controller.display_install_path, wraplength=450).pack(side="left", fill="x", expand=True)
         ttk.Button(folder_display_frame, text="Change", command=controller.change_mods_folder_path, bootstyle="secondary").pack(side="right", padx=(10, 0))
 
-        ttk.Checkbutton(self, text="Use Mirror", variable=controller.use_mirror, bootstyle="primary").pack(pady=10)
+        ttk.Checkbutton(self, text="Use Mirror", variable=controller.use_mirror, bootstyle="primary",
+                        command=controller.on_mirror_toggled).pack(pady=(10, 5))
+        ttk.Checkbutton(self, text="Download from both servers", variable=controller.use_both_endpoints,
+                        bootstyle="primary").pack(pady=(0, 10))
+
+        cap_frame = ttk.Frame(self)
+        cap_frame.pack(pady=(0, 5))
+        ttk.Label(cap_frame, text="Speed limit (Mbps, blank = unlimited):").pack(side="left")
+        ttk.Entry(cap_frame, textvariable=controller.bandwidth_cap, width=8).pack(side="left", padx=(5, 0))
 
         btn_frame = ttk.Frame(self)
         btn_frame.pack(pady=10)
         ttk.Button(btn_frame, text="Confirm", command=controller.start_process, bootstyle="success").pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Verify & Repair", command=lambda: controller.start_process(verify=True), bootstyle="info").pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Quit", command=controller.root.destroy, bootstyle="secondary").pack(side="left", padx=5)
 
     def toggle_advanced_options(self, *args):
@@ -327,14 +495,28 @@ class ProgressFrame(ttk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent, padding=40)
         ttk.Label(self, text="Installing...", font="-size 24 -weight bold").pack(pady=10)
-        progress = ttk.Progressbar(self, mode='indeterminate', bootstyle="success-striped")
-        progress.pack(fill="x", pady=10)
-        progress.start()
+        self.controller = controller
+        # Indeterminate until the first progress event arrives with byte totals
+        self.progress = ttk.Progressbar(self, mode='indeterminate', maximum=100, variable=controller.progress_percent,
+                                        bootstyle="success-striped")
+        self.progress.pack(fill="x", pady=10)
+        self.progress.start()
+        ttk.Label(self, textvariable=controller.progress_detail, justify="center").pack()
         ttk.Label(self, textvariable=controller.status_message, wraplength=500, justify="center").pack(pady=(10, 0))
 
+    def show_progress(self, progress):
+        if not progress["total_bytes"]:
+            return
+        if str(self.progress.cget("mode")) != "determinate":
+            self.progress.stop()
+            self.progress.configure(mode="determinate")
+        self.controller.progress_percent.set(100 * progress["bytes_done"] / progress["total_bytes"])
+        self.controller.progress_detail.set(f"{progress['label'].capitalize()}: {format_progress(progress)}")
+
 if __name__ == '__main__':
     multiprocessing.freeze_support()
 
     root = ttk.Window(themename="litera")
     app = UpdaterApp(root)
     root.mainloop()
+    telemetry.wait_for_uploads()
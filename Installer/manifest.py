@@ -0,0 +1,147 @@
+import os, json, hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+STATE_DIR = ".installer"
+MANIFEST_FILENAME = "manifest.json"
+STATE_FILENAME = "state.json"
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+HASH_WORKERS = 4
+
+def write_json_atomic(path, data):
+    """Writes data as JSON through a temporary file, so an interrupted run never leaves a truncated file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def manifest_path(install_dir):
+    return Path(install_dir) / STATE_DIR / MANIFEST_FILENAME
+
+def empty_manifest():
+    return {"revision": None, "folders": [], "files": {}, "staged": {}}
+
+def load_manifest(install_dir):
+    """
+    Loads the install manifest. A missing or unreadable manifest is treated as
+    an empty one, so every file gets checked against the remote listing.
+    """
+    try:
+        with open(manifest_path(install_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("files"), dict):
+            return {**empty_manifest(), **manifest}
+    except (OSError, ValueError):
+        pass
+    return empty_manifest()
+
+def save_manifest(install_dir, manifest):
+    write_json_atomic(manifest_path(install_dir), manifest)
+
+def load_install_state(install_dir):
+    """Returns the revision and folder set of the last completed sync, or None."""
+    try:
+        with open(Path(install_dir) / STATE_DIR / STATE_FILENAME, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("revision"):
+            return state
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_install_state(install_dir, revision, folders):
+    """
+    Records the commit SHA an install was completed from. Kept separate from the
+    manifest so the startup check only has to read a few bytes.
+    """
+    write_json_atomic(Path(install_dir) / STATE_DIR / STATE_FILENAME,
+                      {"revision": revision, "folders": sorted(folders)})
+
+def remote_entry(repo_file):
+    """
+    Converts a hub RepoFile into a manifest entry. LFS files are identified by
+    the sha256 of their content, regular files by their git blob id. Files
+    stored in xet also keep their xet hash for chunked downloads.
+    """
+    if repo_file.lfs is not None:
+        entry = {"size": repo_file.size, "oid": repo_file.lfs.sha256, "lfs": True}
+        if getattr(repo_file, "xet_hash", None):
+            entry["xet"] = repo_file.xet_hash
+        return entry
+    return {"size": repo_file.size, "oid": repo_file.blob_id, "lfs": False}
+
+def new_hasher(entry):
+    """Returns a hash object that yields the entry's oid once fed the file content."""
+    if entry["lfs"]:
+        return hashlib.sha256()
+    hasher = hashlib.sha1()
+    hasher.update(f"blob {entry['size']}\0".encode())
+    return hasher
+
+def file_oid(path, entry):
+    hasher = new_hasher(entry)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def installed_entry(path, entry):
+    """Manifest entry for a file that is in place and matches the remote entry."""
+    stat = os.stat(path)
+    return {**entry, "mtime_ns": stat.st_mtime_ns}
+
+def is_current(install_dir, manifest, path, entry):
+    local = manifest["files"].get(path)
+    if not local or local["oid"] != entry["oid"]:
+        return False
+    try:
+        return os.path.getsize(Path(install_dir) / path) == entry["size"]
+    except OSError:
+        return False
+
+def adopt_existing_files(install_dir, manifest, remote_files):
+    """
+    Adds files that are already on disk but not yet in the manifest (e.g. an
+    install made before the manifest existed) after checking their content hash.
+    Returns the number of adopted files.
+    """
+    install_dir = Path(install_dir)
+    candidates = []
+    for path, entry in remote_files.items():
+        if path in manifest["files"]:
+            continue
+        local_path = install_dir / path
+        try:
+            if local_path.stat().st_size == entry["size"]:
+                candidates.append((path, entry))
+        except OSError:
+            pass
+
+    def check(item):
+        path, entry = item
+        try:
+            return item if file_oid(install_dir / path, entry) == entry["oid"] else None
+        except OSError:
+            return None
+
+    adopted = 0
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        for result in executor.map(check, candidates):
+            if result:
+                path, entry = result
+                manifest["files"][path] = installed_entry(install_dir / path, entry)
+                adopted += 1
+    return adopted
+
+def changed_files(install_dir, manifest, remote_files):
+    """Paths from the remote listing that are missing locally or differ from the manifest."""
+    return [path for path, entry in remote_files.items()
+            if not is_current(install_dir, manifest, path, entry)]
+
+def removed_upstream(manifest, remote_files, folders):
+    """Manifest paths inside the given repo folders that are no longer in the remote listing."""
+    prefixes = tuple(f"{folder_name}/" for folder_name in folders)
+    return [path for path in manifest["files"]
+            if path.startswith(prefixes) and path not in remote_files]
@@ -0,0 +1,68 @@
+import os, shutil
+from pathlib import Path
+
+from manifest import STATE_DIR, load_manifest, save_manifest
+
+def prune_empty_dirs(root, folders):
+    """Removes empty directories below each of root/folder, deepest first, and the folders themselves if empty."""
+    for folder_name in folders:
+        top = Path(root) / folder_name
+        if not top.is_dir():
+            continue
+        for directory, _, _ in sorted(os.walk(top), key=lambda item: len(item[0]), reverse=True):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+def migrate_install(source_dir, target_dir, target_folders, remove_source_dir=True):
+    """
+    Turns an install of one variant into the starting point for another.
+    Repo folders both variants use are moved into target_dir with renames
+    (a whole folder at a time when the target does not have it yet), together
+    with their manifest entries. Files in folders the target does not use are
+    deleted; only files the source manifest tracks are touched. The source's
+    installer state is removed afterwards, and so is source_dir itself if it
+    ended up empty and remove_source_dir is set.
+
+    Returns (moved folders, removed folders).
+    """
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    source_manifest = load_manifest(source_dir)
+    target_manifest = load_manifest(target_dir)
+    source_folders = {path.split('/', 1)[0] for path in source_manifest["files"]}
+    shared = sorted(source_folders & set(target_folders))
+    unused = sorted(source_folders - set(target_folders))
+
+    for folder_name in shared:
+        prefix = f"{folder_name}/"
+        paths = [path for path in source_manifest["files"] if path.startswith(prefix)]
+        if not (target_dir / folder_name).exists():
+            target_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(source_dir / folder_name, target_dir / folder_name)
+        else:
+            for path in paths:
+                try:
+                    (target_dir / path).parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(source_dir / path, target_dir / path)
+                except OSError:
+                    source_manifest["files"].pop(path, None)
+        for path in paths:
+            if path in source_manifest["files"]:
+                target_manifest["files"][path] = source_manifest["files"].pop(path)
+
+    for folder_name in unused:
+        prefix = f"{folder_name}/"
+        for path in [path for path in source_manifest["files"] if path.startswith(prefix)]:
+            (source_dir / path).unlink(missing_ok=True)
+            source_manifest["files"].pop(path)
+    prune_empty_dirs(source_dir, shared + unused)
+
+    save_manifest(target_dir, target_manifest)
+    shutil.rmtree(source_dir / STATE_DIR, ignore_errors=True)
+    if remove_source_dir:
+        try:
+            os.rmdir(source_dir)
+        except OSError:
+            pass
+    return shared, unused
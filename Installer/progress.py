@@ -0,0 +1,41 @@
+import threading
+from collections import deque
+
+MAX_PENDING = 32
+
+class ProgressQueue:
+    """
+    Hands progress and status events from the sync thread to the UI. The
+    UI drains it on a timer instead of being called per event, and only the
+    newest MAX_PENDING events are kept, so a fast download cannot flood the
+    Tk event loop however often it reports.
+    """
+    def __init__(self, max_pending=MAX_PENDING):
+        self.events = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+
+    def put(self, kind, **fields):
+        with self.lock:
+            self.events.append({"kind": kind, **fields})
+
+    def drain(self):
+        """Returns {kind: newest event of that kind} for everything queued since the last drain."""
+        with self.lock:
+            events, self.events = self.events, deque(maxlen=self.events.maxlen)
+        return {event["kind"]: event for event in events}
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--"
+    seconds = round(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+def format_progress(progress):
+    """One-line summary of a progress event: size done, rate and time left."""
+    return (f"{progress['bytes_done'] / 1024**3:.2f} / {progress['total_bytes'] / 1024**3:.2f} GB  ·  "
+            f"{progress['files_done']} / {progress['total_files']} files  ·  "
+            f"{progress['mbps']:.1f} Mbps  ·  ETA {format_duration(progress['eta_s'])}")
@@ -0,0 +1,229 @@
+import os, sys, json, zlib, argparse
+from pathlib import Path
+
+from manifest import new_hasher
+from ini_index import is_texture
+from downloader import CHUNK_SIZE, REQUEST_TIMEOUT, DownloadError, DownloadCancelled, partial_path
+
+PACKED_DIRNAME = "_packed"
+PACK_INDEX_FILENAME = "index.json"
+PACK_VERSION = 2
+SHARD_SIZE = 256 * 1024**2
+COMPRESSION_LEVEL = 6
+MAX_RANGE_GAP = 1024**2 # Unneeded bytes between two members are read through rather than costing a request
+MAX_RANGE_BYTES = 64 * 1024**2 # Keeps ranges small enough to spread over workers and cheap to retry
+
+class ShardError(Exception):
+    pass
+
+def pack_index_path(folder_name):
+    return f"{PACKED_DIRNAME}/{folder_name}/{PACK_INDEX_FILENAME}"
+
+def pack_folder(repo_root, folder_name, shard_size=SHARD_SIZE, level=COMPRESSION_LEVEL):
+    """
+    Packs one repo folder into shards under <repo_root>/_packed/<folder>/.
+    Every file becomes its own zlib stream (a member) appended to the current
+    shard, and index.json records each member's shard, offset and compressed
+    length together with the file's size, sha256 and git blob id, so a client
+    can fetch any run of members with one range request and inflate them
+    independently. Both hashes are kept because the hub lists a file by its
+    sha256 if it is stored in LFS and by its blob id otherwise, which depends
+    on .gitattributes and file size rather than on the file type.
+
+    Non-texture files come first and everything is in path order, so the ini
+    files of a folder and the textures of each character sit next to each other.
+    """
+    repo_root = Path(repo_root)
+    out_dir = repo_root / PACKED_DIRNAME / folder_name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old_shard in out_dir.glob("shard_*.pack"):
+        old_shard.unlink()
+    paths = sorted((path.relative_to(repo_root).as_posix() for path in (repo_root / folder_name).rglob('*')
+                    if path.is_file()), key=lambda path: (is_texture(path), path))
+
+    shards, files, shard_file = [], {}, None
+    try:
+        for path in paths:
+            if shard_file is None or shard_file.tell() >= shard_size:
+                if shard_file:
+                    shard_file.close()
+                shards.append(f"shard_{len(shards):05d}.pack")
+                shard_file = open(out_dir / shards[-1], 'wb')
+            data = (repo_root / path).read_bytes()
+            oids = {}
+            for key, lfs in (("sha256", True), ("blob_id", False)):
+                hasher = new_hasher({"size": len(data), "lfs": lfs})
+                hasher.update(data)
+                oids[key] = hasher.hexdigest()
+            member = zlib.compress(data, level)
+            files[path] = {"size": len(data), **oids, "shard": len(shards) - 1,
+                           "offset": shard_file.tell(), "length": len(member)}
+            shard_file.write(member)
+    finally:
+        if shard_file:
+            shard_file.close()
+
+    index = {"version": PACK_VERSION, "folder": folder_name, "shards": shards, "files": files}
+    with open(out_dir / PACK_INDEX_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index
+
+def pack_records(index, folder_name):
+    """Member records of a pack index keyed by file path, each with the repo path of its shard."""
+    if index.get("version") != PACK_VERSION or index.get("folder") != folder_name:
+        raise ShardError(f"Unsupported pack index for '{folder_name}'")
+    shard_dir = f"{PACKED_DIRNAME}/{folder_name}"
+    return {path: {**record, "shard_path": f"{shard_dir}/{index['shards'][record['shard']]}"}
+            for path, record in index["files"].items()}
+
+def member_matches(record, entry):
+    """Whether a packed member holds the content of a listing entry, compared by the kind of oid the listing uses."""
+    return record.get("sha256" if entry["lfs"] else "blob_id") == entry["oid"] and record["size"] == entry["size"]
+
+def plan_ranges(entries, records, max_gap=MAX_RANGE_GAP, max_bytes=MAX_RANGE_BYTES):
+    """
+    Groups packed files into byte ranges of their shards. Members less than
+    max_gap apart share a request and the bytes between them are read through;
+    a range is closed once it spans max_bytes.
+
+    Returns:
+        list: (shard path, range entry) pairs. A range entry has start, end
+        (exclusive) and size in shard bytes, and its members as
+        (path, entry, record) in offset order.
+    """
+    by_shard = {}
+    for path, entry in entries.items():
+        record = records[path]
+        by_shard.setdefault(record["shard_path"], []).append((path, entry, record))
+    ranges = []
+    for shard, members in sorted(by_shard.items()):
+        current = None
+        for member in sorted(members, key=lambda member: member[2]["offset"]):
+            start = member[2]["offset"]
+            end = start + member[2]["length"]
+            if current and start - current["end"] <= max_gap and end - current["start"] <= max_bytes:
+                current["members"].append(member)
+                current["end"] = end
+            else:
+                current = {"start": start, "end": end, "members": [member]}
+                ranges.append((shard, current))
+    for _, current in ranges:
+        current["size"] = current["end"] - current["start"]
+    return ranges
+
+class RangeReader:
+    """Reads exact byte counts from a stream of chunks, handing out views instead of copies."""
+    def __init__(self, chunks, on_chunk):
+        self.chunks = iter(chunks)
+        self.on_chunk = on_chunk
+        self.view = memoryview(b"")
+
+    def read(self, count):
+        """Yields the next count bytes in pieces."""
+        while count > 0:
+            if not self.view:
+                chunk = next(self.chunks, b"")
+                if not chunk:
+                    raise ShardError("Shard range ended early")
+                self.on_chunk(chunk)
+                self.view = memoryview(chunk)
+            piece, self.view = self.view[:count], self.view[count:]
+            count -= len(piece)
+            yield piece
+
+    def skip(self, count):
+        for _ in self.read(count):
+            pass
+
+def extract_members(reader, start, members, install_dir, tmp_dir):
+    """
+    Inflates the members of a shard range, read from its offset start, into
+    install_dir. Each file is written to tmp_dir, checked against the size
+    and oid of its remote entry and only then moved into place.
+    """
+    position = start
+    for path, entry, record in members:
+        reader.skip(record["offset"] - position)
+        dest = Path(install_dir) / path
+        tmp_path = partial_path(tmp_dir, dest, entry)
+        decompressor = zlib.decompressobj()
+        hasher, written = new_hasher(entry), 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for piece in reader.read(record["length"]):
+                    data = decompressor.decompress(piece)
+                    f.write(data)
+                    hasher.update(data)
+                    written += len(data)
+                data = decompressor.flush()
+                f.write(data)
+                hasher.update(data)
+                written += len(data)
+            if not decompressor.eof or written != entry["size"] or hasher.hexdigest() != entry["oid"]:
+                raise ShardError(f"Verification failed for '{dest.name}'")
+        except zlib.error as e:
+            tmp_path.unlink(missing_ok=True)
+            raise ShardError(f"Corrupt shard member '{dest.name}': {e}") from e
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, dest)
+        position = record["offset"] + record["length"]
+
+def download_range(session, url, headers, dest, entry, tmp_dir, on_bytes=None,
+                   chunk_size=CHUNK_SIZE, rate_limiter=None, stop_event=None):
+    """
+    Fetches one range of a shard and extracts its members into dest, the
+    install folder, as the bytes arrive; the shard itself never touches the
+    disk. Same interface as download_file, so the scheduler runs ranges on
+    the same workers, endpoints and retries. A failed range is fetched again
+    as a whole; members it already put in place are verified and stay.
+    """
+    Path(tmp_dir).mkdir(parents=True, exist_ok=True)
+    received = 0
+
+    def on_chunk(chunk):
+        nonlocal received
+        if stop_event and stop_event.is_set():
+            raise DownloadCancelled()
+        if rate_limiter:
+            rate_limiter.consume(len(chunk))
+        received += len(chunk)
+        if on_bytes:
+            on_bytes(len(chunk))
+
+    try:
+        range_headers = dict(headers, Range=f"bytes={entry['start']}-{entry['end'] - 1}")
+        with session.get(url, headers=range_headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            # A server that ignores the range sends the whole shard, which is read through to the start
+            start = entry["start"] if response.status_code == 206 else 0
+            reader = RangeReader(response.iter_content(chunk_size), on_chunk)
+            extract_members(reader, start, entry["members"], dest, tmp_dir)
+    except ShardError as e:
+        if on_bytes:
+            on_bytes(-received)
+        raise DownloadError(str(e)) from e
+    except BaseException:
+        if on_bytes:
+            on_bytes(-received)
+        raise
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packs repo folders into shards for the packed download layout.")
+    parser.add_argument("repo_root", help="local checkout of the dataset")
+    parser.add_argument("folders", nargs='+', help="repo folders to pack, e.g. Base_4X Core_2X")
+    parser.add_argument("--shard-size-mb", type=int, default=SHARD_SIZE // 1024**2)
+    parser.add_argument("--level", type=int, default=COMPRESSION_LEVEL, help="zlib compression level")
+    args = parser.parse_args(argv)
+    for folder_name in args.folders:
+        index = pack_folder(args.repo_root, folder_name, args.shard_size_mb * 1024**2, args.level)
+        raw = sum(record["size"] for record in index["files"].values())
+        packed = sum(record["length"] for record in index["files"].values())
+        print(f"{folder_name}: {len(index['files'])} files in {len(index['shards'])} shards, "
+              f"{raw / 1024**2:.0f} MB -> {packed / 1024**2:.0f} MB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
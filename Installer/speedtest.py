@@ -1,13 +1,21 @@
-import os, sys, time
-from pathlib import Path
-import shutil
-import multiprocessing
-import queue
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 
 SPEED_TEST_REPO_ID = "google-bert/bert-base-uncased"
 SPEED_TEST_FILENAME = "model.safetensors"
-CACHE_DIR = Path(sys.executable).parent / ".speedtest_cache" if getattr(sys, 'frozen', False) else Path(".speedtest_cache")
+PARALLEL_STREAMS = 4
+RANGE_SIZE = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+SAMPLE_INTERVAL = 0.25
+ROLLING_WINDOW = 1.0
+MIN_DURATION = 1.5
+STABLE_SAMPLES = 4
+STABLE_TOLERANCE = 0.1
+PROBE_TIMEOUT = 5
+PROBE_BYTES = 2 * 1024 * 1024
+PROBE_SAMPLE_SECONDS = 2.0
 
 def test_connection(url, timeout=5):
     """
@@ -21,37 +29,69 @@ def test_connection(url, timeout=5):
     except requests.RequestException:
         return False
 
+def probe_endpoint(use_mirror, timeout=PROBE_TIMEOUT):
+    """
+    Measures the round-trip time of a HEAD request to the endpoint and, if it
+    is reachable, a short throughput sample from a ranged GET of the speed
+    test file.
+
+    Returns:
+        dict: use_mirror, endpoint, reachable, rtt_ms and mbps.
+    """
+    endpoint = get_endpoint(use_mirror)
+    result = {"use_mirror": use_mirror, "endpoint": endpoint, "reachable": False, "rtt_ms": None, "mbps": 0.0}
+    try:
+        start_time = time.time()
+        response = requests.head(endpoint, timeout=timeout)
+        result["rtt_ms"] = round((time.time() - start_time) * 1000, 1)
+        result["reachable"] = response.status_code == 200
+    except requests.RequestException:
+        return result
+    if not result["reachable"]:
+        return result
+
+    received = 0
+    start_time = time.time()
+    try:
+        headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+        with requests.get(speed_test_url(use_mirror), headers=headers, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                received += len(chunk)
+                if time.time() - start_time > PROBE_SAMPLE_SECONDS:
+                    break
+    except requests.RequestException:
+        pass
+    result["mbps"] = round(calculate_speed_mbps(start_time, time.time(), received), 2)
+    return result
+
+def probe_endpoints(timeout=PROBE_TIMEOUT):
+    """Probes Hugging Face and its mirror concurrently. Returns one probe_endpoint result per endpoint."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return list(executor.map(lambda use_mirror: probe_endpoint(use_mirror, timeout), (False, True)))
+
+def choose_mirror(results):
+    """
+    Picks the faster usable endpoint from probe results, using the lower
+    round-trip time when neither produced a throughput sample.
+
+    Returns:
+        bool: True if the mirror should be used, False otherwise.
+    """
+    usable = [result for result in results if result["reachable"]]
+    if not usable:
+        return False
+    best = max(usable, key=lambda result: (result["mbps"], -(result["rtt_ms"] or 0)))
+    return best["use_mirror"]
+
 def determine_mirror_setting():
     """
-    Checks connection to Hugging Face and its mirror. Recommends the mirror
-    only if the main site is unreachable and the mirror is reachable.
-    
+    Races Hugging Face and its mirror and recommends the faster reachable one.
+
     Returns:
         bool: True if the mirror should be used, False otherwise.
     """
-    if not test_connection("https://huggingface.co"):
-        if test_connection("https://hf-mirror.com"):
-            return True
-    return False
-
-def setup_hf_environment(use_mirror):
-    """Sets Hugging Face environment variables for the test."""
-    os.environ["HF_HOME"] = str(CACHE_DIR)
-    
-    os.environ["HF_HUB_DISABLE_PROGRESS_BARS"] = "1"
-    if use_mirror:
-        os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
-    elif 'HF_ENDPOINT' in os.environ:
-        # Ensure mirror endpoint is not set if not requested
-        del os.environ['HF_ENDPOINT']
-
-def cleanup_cache():
-    """Removes the speed test cache directory."""
-    if CACHE_DIR.is_dir():
-        try:
-            shutil.rmtree(CACHE_DIR)
-        except OSError:
-            pass
+    return choose_mirror(probe_endpoints())
 
 def calculate_speed_mbps(start_time, end_time, downloaded_bytes):
     """Calculates download speed in Megabits per second (Mbps)."""
@@ -63,64 +103,86 @@ def calculate_speed_mbps(start_time, end_time, downloaded_bytes):
         return speed_mbps
     return 0.0
 
-def download_target(repo_id, filename, result_queue):
-    """Target function for the download process. To be run in a separate process."""
-    from huggingface_hub import hf_hub_download, get_hf_file_metadata, hf_hub_url
-    
-    try:
-        start_time = time.time()
-        hf_hub_download(
-            repo_id=repo_id,
-            filename=filename
-        )
-        end_time = time.time()
-
-        url = hf_hub_url(repo_id=repo_id, filename=filename)
-        metadata = get_hf_file_metadata(url=url)
-        file_size = metadata.size
-
-        result_queue.put({
-            "size": file_size,
-            "start_time": start_time,
-            "end_time": end_time
-        })
-    except Exception as e:
-        result_queue.put(e)
-
-def measure_download_speed(use_mirror, timeout=20):
-    setup_hf_environment(use_mirror)
-    cleanup_cache()
-
-    result_queue = multiprocessing.Queue()
-    download_process = multiprocessing.Process(
-        target=download_target,
-        args=(SPEED_TEST_REPO_ID, SPEED_TEST_FILENAME, result_queue)
-    )
+def get_endpoint(use_mirror):
+    return "https://hf-mirror.com" if use_mirror else "https://huggingface.co"
 
+def speed_test_url(use_mirror):
+    return f"{get_endpoint(use_mirror)}/{SPEED_TEST_REPO_ID}/resolve/main/{SPEED_TEST_FILENAME}"
+
+def stream_range(session, url, start, end, counter, stop_event):
+    """Streams one byte range and adds every received chunk to the shared counter. Nothing is stored."""
     try:
-        download_process.start()
-        download_process.join(timeout)
-
-        if download_process.is_alive():
-            download_process.terminate()
-            download_process.join()
-            raise TimeoutError(f"Test timed out after {timeout} seconds. Connection may be too slow.")
-
-        result = result_queue.get_nowait()
-        
-        if isinstance(result, Exception):
-            raise result
-
-        if isinstance(result, dict):
-            speed_mbps = calculate_speed_mbps(result["start_time"], result["end_time"], result["size"])
-            return speed_mbps
-        else:
-            raise ValueError("Download process returned an unexpected result.")
-
-    except Exception as e:
-        raise e
-    finally:
-        if download_process.is_alive():
-            download_process.terminate()
-            download_process.join()
-        cleanup_cache()
+        headers = {"Range": f"bytes={start}-{end}"}
+        with session.get(url, headers=headers, stream=True, timeout=(5, 10)) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                counter.add(len(chunk))
+                if stop_event.is_set():
+                    break
+    except requests.RequestException:
+        pass
+
+class ByteCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+
+    def add(self, count):
+        with self.lock:
+            self.total += count
+
+def is_stable(estimates):
+    """True when the last few rolling estimates agree within STABLE_TOLERANCE of their mean."""
+    recent = estimates[-STABLE_SAMPLES:]
+    if len(recent) < STABLE_SAMPLES:
+        return False
+    mean = sum(recent) / len(recent)
+    return mean > 0 and all(abs(value - mean) <= STABLE_TOLERANCE * mean for value in recent)
+
+def measure_download_speed(use_mirror, timeout=20, streams=PARALLEL_STREAMS, url=None):
+    """
+    Measures download speed by streaming several byte ranges of the speed test
+    file in parallel and computing a rolling throughput. Stops as soon as the
+    estimate is stable, on timeout (returning the partial measurement), or
+    when all ranges are done. Nothing is written to disk. url overrides the
+    speed test file, e.g. to measure against a local server.
+
+    Returns:
+        float: Download speed in Mbps.
+    """
+    url = url or speed_test_url(use_mirror)
+    counter, stop_event = ByteCounter(), threading.Event()
+    samples, estimates = [], []
+
+    with requests.Session() as session:
+        threads = [
+            threading.Thread(
+                target=stream_range,
+                args=(session, url, i * RANGE_SIZE, (i + 1) * RANGE_SIZE - 1, counter, stop_event),
+                daemon=True
+            )
+            for i in range(streams)
+        ]
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        try:
+            while time.time() - start_time < timeout and any(thread.is_alive() for thread in threads):
+                time.sleep(SAMPLE_INTERVAL)
+                now = time.time()
+                samples.append((now, counter.total))
+                window = [sample for sample in samples if sample[0] >= now - ROLLING_WINDOW]
+                if counter.total and len(window) > 1:
+                    estimates.append(calculate_speed_mbps(window[0][0], now, window[-1][1] - window[0][1]))
+                if now - start_time >= MIN_DURATION and is_stable(estimates):
+                    break
+        finally:
+            stop_event.set()
+            end_time = time.time()
+
+    if is_stable(estimates):
+        return sum(estimates[-STABLE_SAMPLES:]) / STABLE_SAMPLES
+    speed_mbps = calculate_speed_mbps(start_time, end_time, counter.total)
+    if speed_mbps <= 0:
+        raise ConnectionError("Speed test could not download any data.")
+    return speed_mbps
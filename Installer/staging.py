@@ -0,0 +1,126 @@
+import os, shutil
+from pathlib import Path
+
+from manifest import STATE_DIR, save_manifest
+from ini_index import texture_name
+
+STAGING_DIRNAME = "DISABLED_staging"
+SPACE_MARGIN = 256 * 1024**2 # Headroom for partial downloads, manifests and the game's own writes
+
+class NotEnoughSpace(Exception):
+    pass
+
+def stage_dir(install_dir):
+    """
+    Where an update's new files wait until all of them are verified; on the
+    install's volume so the swap is renames only. The game loads every ini
+    file under Mods, so the directory name keeps it from picking up staged ones.
+    """
+    return Path(install_dir) / STATE_DIR / STAGING_DIRNAME
+
+def check_disk_space(install_dir, required_bytes):
+    """Raises NotEnoughSpace if the install's volume cannot take required_bytes more."""
+    free = shutil.disk_usage(install_dir).free
+    if required_bytes + SPACE_MARGIN > free:
+        raise NotEnoughSpace(
+            f"Not enough disk space: {required_bytes / 1024**3:.2f} GB is needed on the drive of "
+            f"'{install_dir}', but only {free / 1024**3:.2f} GB is free."
+        )
+
+def is_staged(install_dir, manifest, path, entry):
+    """Whether a verified copy of this version of the file is already staged, e.g. by an interrupted run."""
+    staged = manifest["staged"].get(path)
+    if not staged or staged["oid"] != entry["oid"]:
+        return False
+    try:
+        return os.path.getsize(stage_dir(install_dir) / path) == entry["size"]
+    except OSError:
+        return False
+
+def swap_in(install_dir, manifest, path):
+    """Moves one staged file over the live one and records it as installed."""
+    staged_path = stage_dir(install_dir) / path
+    if staged_path.exists():
+        (Path(install_dir) / path).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged_path, Path(install_dir) / path)
+    manifest["files"][path] = manifest["staged"].pop(path)
+
+class UnitCommitter:
+    """
+    Makes a fresh install usable piece by piece. A unit is an ini file
+    together with the files it references; as soon as none of them is still
+    to be downloaded, the unit's staged files are swapped in. An interrupted
+    install keeps every complete unit, and an ini file never goes live before
+    its textures. Updates do not use this: they replace live files and are
+    swapped in all at once by commit_staged. Callers serialize file_done with
+    their manifest updates.
+    """
+    def __init__(self, install_dir, manifest, expected, references, pending):
+        """references maps ini paths to the file names they reference; pending is the set of paths still to download."""
+        self.install_dir, self.manifest, self.expected = install_dir, manifest, expected
+        by_name = {}
+        for path in expected:
+            by_name.setdefault(texture_name(path), []).append(path)
+        self.units = {
+            ini: {ini, *(path for name in names for path in by_name.get(name, ()))}
+            for ini, names in references.items() if ini in expected
+        }
+        self.waiting = {ini: files & pending for ini, files in self.units.items()}
+        self.units_of = {}
+        for ini, files in self.waiting.items():
+            for path in files:
+                self.units_of.setdefault(path, []).append(ini)
+        self.committed = 0
+
+    def first_unit(self, path):
+        """The first unit, in path order, that waits for path; used to order downloads unit by unit."""
+        return min(self.units_of.get(path, ()), default=None)
+
+    def commit_ready(self):
+        for ini in [ini for ini, waiting in self.waiting.items() if not waiting]:
+            self.commit_unit(ini)
+
+    def file_done(self, path):
+        for ini in self.units_of.pop(path, ()):
+            waiting = self.waiting.get(ini)
+            if waiting is not None:
+                waiting.discard(path)
+                if not waiting:
+                    self.commit_unit(ini)
+
+    def commit_unit(self, ini):
+        del self.waiting[ini]
+        for path in self.units[ini]:
+            staged = self.manifest["staged"].get(path)
+            if staged and staged["oid"] == self.expected[path]["oid"]:
+                swap_in(self.install_dir, self.manifest, path)
+        self.committed += 1
+
+def commit_staged(install_dir, manifest, expected):
+    """
+    Swaps the staged files in over the live ones in one go. For an update
+    this is the only swap; for a fresh install it takes the units that did
+    not already go live on their own. Staged files that are no longer in
+    expected (changed again or removed upstream since they were staged) are
+    dropped first. The manifest is marked as committing while the renames
+    run, so an interrupted swap is finished by finish_commit on the next run
+    instead of leaving a half-updated install behind.
+    """
+    staging = stage_dir(install_dir)
+    for path, entry in list(manifest["staged"].items()):
+        if expected.get(path, {}).get("oid") != entry["oid"]:
+            (staging / path).unlink(missing_ok=True)
+            del manifest["staged"][path]
+    manifest["committing"] = True
+    save_manifest(install_dir, manifest)
+    return finish_commit(install_dir, manifest)
+
+def finish_commit(install_dir, manifest):
+    """Moves every staged file into place and records it as installed. Returns the number of files swapped in."""
+    swapped = len(manifest["staged"])
+    for path in list(manifest["staged"]):
+        swap_in(install_dir, manifest, path)
+    manifest.pop("committing", None)
+    save_manifest(install_dir, manifest)
+    shutil.rmtree(stage_dir(install_dir), ignore_errors=True)
+    return swapped
@@ -0,0 +1,139 @@
+import os, sys, json, time, shutil, threading
+from pathlib import Path
+
+from manifest import write_json_atomic
+
+STORE_DIRNAME = ".texturepp_store"
+INDEX_FILENAME = "index.json"
+DEFAULT_MAX_BYTES = 20 * 1024**3
+FICLONE = 0x40049409 # Linux reflink ioctl
+
+def reflink(src, dst):
+    """Copy-on-write clone of src to dst. Only available on Linux filesystems that support it."""
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are not supported on this platform")
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+def share_file(src, dst):
+    """Makes dst share src's data on disk: a hardlink, or a reflink where hardlinks are not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        try:
+            reflink(src, dst)
+        except OSError:
+            Path(dst).unlink(missing_ok=True)
+            raise
+
+class ContentStore:
+    """
+    Content-addressed file store shared by every install in a Mods folder.
+    Objects are keyed by the file's oid from the remote listing and installs
+    draw from them via hardlinks (or reflinks), so a file shared by several
+    variants is downloaded and stored once.
+
+    Objects still linked into an install cost no extra disk. Objects only the
+    store holds (e.g. after switching variants) are evicted least recently
+    used first once they exceed max_bytes.
+    """
+    def __init__(self, mods_folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(mods_folder) / STORE_DIRNAME
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        try:
+            with open(self.root / INDEX_FILENAME, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def object_path(self, oid):
+        return self.root / "objects" / oid[:2] / oid
+
+    def has(self, entry):
+        try:
+            return self.object_path(entry["oid"]).stat().st_size == entry["size"]
+        except OSError:
+            return False
+
+    def touch(self, entry):
+        with self.lock:
+            self.index[entry["oid"]] = {"size": entry["size"], "last_used": time.time()}
+
+    def add(self, path, entry):
+        """Adds an installed, verified file to the store by linking it. Never copies."""
+        object_path = self.object_path(entry["oid"])
+        if not self.has(entry):
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = object_path.with_name(f"{object_path.name}.{threading.get_ident()}.tmp")
+            try:
+                share_file(path, tmp_path)
+                os.replace(tmp_path, object_path)
+            except OSError:
+                return False
+        self.touch(entry)
+        return True
+
+    def materialize(self, entry, dest):
+        """Links the stored object for entry to dest. Returns False if that is not possible."""
+        object_path = self.object_path(entry["oid"])
+        dest = Path(dest)
+        try:
+            if dest.exists() and os.path.samefile(dest, object_path):
+                self.touch(entry)
+                return True
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = dest.with_name(f"{dest.name}.{threading.get_ident()}.tmp")
+            share_file(object_path, tmp_path)
+            os.replace(tmp_path, dest)
+        except OSError:
+            return False
+        self.touch(entry)
+        return True
+
+    def discard(self, entry):
+        """Drops an object, e.g. when the installed file it is linked to turned out to be corrupted."""
+        self.object_path(entry["oid"]).unlink(missing_ok=True)
+        with self.lock:
+            self.index.pop(entry["oid"], None)
+
+    def evict(self):
+        """
+        Removes objects that no install links to anymore, least recently used
+        first, until those unshared objects fit in max_bytes. Returns bytes freed.
+        """
+        unshared = []
+        for oid, info in self.index.items():
+            try:
+                stat = self.object_path(oid).stat()
+            except OSError:
+                continue
+            if stat.st_nlink <= 1:
+                unshared.append((info["last_used"], oid, stat.st_size))
+        unshared.sort()
+        excess = sum(size for _, _, size in unshared) - self.max_bytes
+        freed = 0
+        for _, oid, size in unshared:
+            if freed >= excess:
+                break
+            self.object_path(oid).unlink(missing_ok=True)
+            self.index.pop(oid, None)
+            freed += size
+        self.index = {oid: info for oid, info in self.index.items() if self.object_path(oid).exists()}
+        return freed
+
+    def save(self):
+        with self.lock:
+            write_json_atomic(self.root / INDEX_FILENAME, self.index)
+
+def remove_legacy_cache(install_dir, repo_id):
+    """
+    Removes download caches left by older installer versions: the hub cache
+    for this dataset only, and the snapshot metadata folder in the install.
+    Other Hugging Face caches on the machine are left alone.
+    """
+    hf_home = os.getenv("HF_HOME", Path.home() / ".cache" / "huggingface")
+    for cache_dir in (Path(hf_home) / "hub" / f"datasets--{repo_id.replace('/', '--')}",
+                      Path(install_dir) / ".cache" / "huggingface"):
+        shutil.rmtree(cache_dir, ignore_errors=True)
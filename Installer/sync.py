@@ -1,12 +1,30 @@
-import os, sys, socket
-import re, json, wmi
-import requests, pythoncom
-from io import StringIO
-from datetime import datetime, timezone
+import os, time, shutil, threading
+import json
 from pathlib import Path
-import shutil
-from contextlib import contextmanager
-from secrets import REPO_ID, REPO_TOKEN, LOG_REPO_ID, LOG_TOKEN
+from secrets import REPO_ID, REPO_TOKEN
+from manifest import (STATE_DIR, write_json_atomic, load_manifest, save_manifest, load_install_state, save_install_state,
+                      remote_entry, installed_entry, adopt_existing_files, changed_files, removed_upstream)
+from downloader import DownloadScheduler, DownloadCancelled, REQUEST_TIMEOUT
+from shards import pack_index_path, pack_records, member_matches, plan_ranges, download_range
+from ini_index import (scan_install, load_index, update_index, referenced_textures, remove_orphans,
+                       is_texture, texture_name)
+from telemetry import TelemetryProbes, spool_log, flush_spool_in_background
+from store import STORE_DIRNAME, ContentStore, remove_legacy_cache
+from migrate import migrate_install
+from speedtest import get_endpoint
+from verify import verify_install, save_report, expected_from_manifest
+from timing import PhaseTimer, profiled
+from logcapture import LogCapture
+from xetcache import XetDownloader, xet_available, uses_xet, batch_entries
+from staging import (NotEnoughSpace, UnitCommitter, stage_dir, check_disk_space, is_staged, commit_staged,
+                     finish_commit)
+from concurrent.futures import ThreadPoolExecutor
+
+LINK_WORKERS = 8
+CHECKPOINT_INTERVAL = 10.0 # Seconds between manifest saves during a download
+TMP_DIRNAME = "tmp"
+LISTINGS_DIRNAME = "listings"
+PROFILE_ENV = "TEXTUREPP_PROFILE"
 
 VARIANT_MAP = {
     "Mini": {"repo_folders": ["Texture++ Mini"], "local_dir": "Texture++ Mini", "size_gb": 1.0},
@@ -15,174 +33,668 @@ VARIANT_MAP = {
     "Core 4K": {"repo_folders": ["Base_4X", "Core_4X"], "local_dir": "Texture++ Core 4K", "size_gb": 27.0},
     "Advanced": {"repo_folders": [], "local_dir": "Texture++ Custom"}
 }
+# Download order across folders: the base textures make an install usable before the higher-resolution sets
+FOLDER_PRIORITY = ["Texture++ Mini", "Base_4X", "Core_2X", "Core_4X"]
+
+def get_endpoints(use_mirror, use_both=False):
+    """Endpoints to download from, preferred one first."""
+    endpoints = [get_endpoint(use_mirror)]
+    if use_both:
+        endpoints.append(get_endpoint(not use_mirror))
+    return endpoints
+
+def call_with_failover(endpoints, call):
+    """
+    Runs call(api) against each endpoint in turn until one succeeds. The
+    endpoint that answered is moved to the front so later calls try it first.
+    """
+    from huggingface_hub import HfApi
+    for i, endpoint in enumerate(list(endpoints)):
+        try:
+            result = call(HfApi(endpoint=endpoint, token=REPO_TOKEN))
+        except Exception:
+            if i == len(endpoints) - 1:
+                raise
+            continue
+        endpoints.remove(endpoint)
+        endpoints.insert(0, endpoint)
+        return result
+
+def get_install_dir(mods_folder, variant):
+    if variant != 'Mini':
+        return Path(mods_folder) / VARIANT_MAP[variant]["local_dir"]
+    return Path(mods_folder)
+
+def get_remote_revision(use_mirror, timeout=10):
+    from huggingface_hub import HfApi
+    api = HfApi(endpoint=get_endpoint(use_mirror), token=REPO_TOKEN)
+    return api.dataset_info(REPO_ID, timeout=timeout).sha
+
+def is_up_to_date(mods_folder, variant, remote_revision):
+    if not remote_revision or variant not in VARIANT_MAP:
+        return False
+    state = load_install_state(get_install_dir(mods_folder, variant))
+    return (state is not None and state["revision"] == remote_revision
+            and set(VARIANT_MAP[variant]["repo_folders"]) <= set(state["folders"]))
+
+def find_migration_source(mods_folder, variant):
+    """
+    Finds an install of another variant that a fresh install of the target
+    can be built from: the one sharing the most repo folders with it, and at
+    least one. Returns the variant name, or None if there is none or the
+    target is already installed.
+    """
+    if load_manifest(get_install_dir(mods_folder, variant))["files"]:
+        return None
+    target_folders = set(VARIANT_MAP[variant]["repo_folders"])
+    candidates = []
+    for other in VARIANT_MAP:
+        if other == variant or get_install_dir(mods_folder, other) == get_install_dir(mods_folder, variant):
+            continue
+        state = load_install_state(get_install_dir(mods_folder, other))
+        if state and (overlap := len(target_folders & set(state["folders"]))):
+            candidates.append((overlap, other))
+    return max(candidates)[1] if candidates else None
+
+def list_remote_files(api, folder_name, revision):
+    from huggingface_hub.hf_api import RepoFile
+    return {
+        item.path: remote_entry(item)
+        for item in api.list_repo_tree(REPO_ID, path_in_repo=folder_name, recursive=True,
+                                       revision=revision, repo_type="dataset")
+        if isinstance(item, RepoFile)
+    }
 
-@contextmanager
-def redirect_stdout_stderr(target_buffer):
-    original_stdout, original_stderr = sys.stdout, sys.stderr
-    sys.stdout, sys.stderr = target_buffer, target_buffer
+def listing_cache_path(mods_folder, folder_name):
+    return Path(mods_folder) / STORE_DIRNAME / LISTINGS_DIRNAME / f"{folder_name}.json"
+
+def load_cached_listing(mods_folder, folder_name, revision):
     try:
-        yield
-    finally:
-        sys.stdout, sys.stderr = original_stdout, original_stderr
+        with open(listing_cache_path(mods_folder, folder_name), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached["files"] if cached["revision"] == revision else None
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_cached_listing(mods_folder, folder_name, revision, files):
+    write_json_atomic(listing_cache_path(mods_folder, folder_name), {"revision": revision, "files": files})
+
+def find_cached_listing(mods_folder, listings, cache_name, revision):
+    """
+    A cached listing from listings, an in-process dict shared by the targets
+    of one run, or else from the cache in mods_folder. Returns None if neither has it.
+    """
+    if listings is not None and (cache_name, revision) in listings:
+        return listings[(cache_name, revision)]
+    if mods_folder:
+        return load_cached_listing(mods_folder, cache_name, revision)
+    return None
+
+def keep_listing(mods_folder, listings, cache_name, revision, files):
+    if listings is not None:
+        listings[(cache_name, revision)] = files
+    if mods_folder and load_cached_listing(mods_folder, cache_name, revision) is None:
+        save_cached_listing(mods_folder, cache_name, revision, files)
+
+def list_variant_files(endpoints, folders, revision, log, mods_folder=None, listings=None):
+    """
+    Remote files of the given repo folders at revision. A listing for a
+    revision never changes, so with mods_folder each folder's listing is
+    cached there and only fetched again for a new revision. listings, if
+    given, is an in-process cache shared by several targets of one run.
+    """
+    remote_files = {}
+    for folder_name in folders:
+        listing = find_cached_listing(mods_folder, listings, folder_name, revision)
+        if listing is None:
+            log(f"Checking '{folder_name}'...")
+            listing = call_with_failover(endpoints, lambda api: list_remote_files(api, folder_name, revision))
+        keep_listing(mods_folder, listings, folder_name, revision, listing)
+        remote_files.update(listing)
+    return remote_files
+
+def fetch_pack_records(endpoints, folder_name, revision, session=None):
+    """Member records of a folder's packed layout, or {} if the repo has not packed it."""
+    import requests
+    from huggingface_hub import hf_hub_url
+    from huggingface_hub.utils import build_hf_headers
+    get = session.get if session else requests.get
+
+    def fetch(api):
+        url = hf_hub_url(REPO_ID, pack_index_path(folder_name), repo_type="dataset", revision=revision,
+                         endpoint=api.endpoint)
+        response = get(url, headers=build_hf_headers(token=REPO_TOKEN), timeout=REQUEST_TIMEOUT)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        return pack_records(response.json(), folder_name)
+
+    return call_with_failover(endpoints, fetch)
+
+def load_pack_records(endpoints, folders, revision, log, mods_folder=None, session=None, listings=None):
+    """
+    Packed shard records for the given folders keyed by file path; folders
+    without a packed layout contribute nothing. Cached per revision next to
+    the listings.
+    """
+    records = {}
+    for folder_name in folders:
+        cache_name = f"{folder_name}.packed"
+        folder_records = find_cached_listing(mods_folder, listings, cache_name, revision)
+        if folder_records is None:
+            try:
+                folder_records = fetch_pack_records(endpoints, folder_name, revision, session)
+            except Exception as e:
+                log(f"Packed files for '{folder_name}' unavailable ({e}); downloading files individually.")
+                continue
+        keep_listing(mods_folder, listings, cache_name, revision, folder_records)
+        records.update(folder_records)
+    return records
+
+def estimate_download(mods_folder, variant, use_mirror, remote_revision=None, folders=None, endpoints=None):
+    """
+    Size of what an install or update would actually download: the files
+    the variant needs at the remote revision, minus those already installed
+    with the same content or available from the local store. Textures count
+    only if an installed ini file references them (all of them on a fresh
+    install). Files staged by an interrupted update count as present. Uses
+    the cached listing when the revision has not changed.
 
-def get_hardware_info():
+    Returns:
+        dict: revision, bytes and files to download, and total_bytes of the variant.
+    """
+    endpoints = endpoints or get_endpoints(use_mirror)
+    folders = folders if folders is not None else VARIANT_MAP[variant]["repo_folders"]
+    revision = remote_revision or call_with_failover(endpoints, lambda api: api.dataset_info(REPO_ID).sha)
+    remote_files = list_variant_files(endpoints, folders, revision, lambda message: None, mods_folder)
+    install_dir = get_install_dir(mods_folder, variant)
+    manifest = load_manifest(install_dir)
+    index = load_index(install_dir)
+    referenced = referenced_textures(index) if index["inis"] else None
+    needed = {
+        path: entry for path, entry in remote_files.items()
+        if not is_texture(path) or referenced is None or texture_name(path) in referenced
+    }
+    store = ContentStore(mods_folder)
+    missing = [
+        entry for path, entry in needed.items()
+        if manifest["files"].get(path, {}).get("oid") != entry["oid"] and not store.has(entry)
+        and not is_staged(install_dir, manifest, path, entry)
+    ]
+    return {
+        "revision": revision,
+        "bytes": sum(entry["size"] for entry in missing),
+        "files": len(missing),
+        "total_bytes": sum(entry["size"] for entry in needed.values())
+    }
+
+def folder_rank(path):
+    folder_name = path.split('/', 1)[0]
+    return FOLDER_PRIORITY.index(folder_name) if folder_name in FOLDER_PRIORITY else len(FOLDER_PRIORITY)
+
+def check_stop(stop_event):
+    if stop_event and stop_event.is_set():
+        raise DownloadCancelled()
+
+def new_scheduler(endpoints, revision, install_dir, download_speed_mbps=None, max_workers=None, bandwidth_cap_mbps=None,
+                  session=None, stop_event=None):
+    from huggingface_hub import hf_hub_url
+    from huggingface_hub.utils import build_hf_headers
+    return DownloadScheduler(
+        endpoints,
+        lambda endpoint, path: hf_hub_url(REPO_ID, path, repo_type="dataset", revision=revision, endpoint=endpoint),
+        build_hf_headers(token=REPO_TOKEN), install_dir / STATE_DIR / TMP_DIRNAME,
+        download_speed_mbps, max_workers, bandwidth_cap_mbps, session, stop_event=stop_event,
+        fetch_range=download_range
+    )
+
+def new_xet_downloader(mods_folder, endpoint, revision, install_dir, log):
+    """XetDownloader for the repo at revision, or None if hf_xet is missing or cannot start."""
+    if not xet_available():
+        return None
+    from huggingface_hub.utils import build_hf_headers
+    from huggingface_hub.utils._xet import XetTokenType, xet_connection_info_refresh_url
+    refresh_url = xet_connection_info_refresh_url(token_type=XetTokenType.READ, repo_id=REPO_ID, repo_type="dataset",
+                                                  revision=revision, endpoint=endpoint)
     try:
-        pythoncom.CoInitialize() # Initialize COM for WMI calls
-        c = wmi.WMI()
-        system_info = c.Win32_ComputerSystem()[0]
-        os_info = c.Win32_OperatingSystem()[0]
-        ram_size = round(int(system_info.TotalPhysicalMemory) / (1024**3), 2)
-        ram_modules = c.Win32_PhysicalMemory()
-        ram_speed_mhz = ram_modules[0].Speed if ram_modules else "N/A"
-        disk_info = []
-        for disk in c.Win32_LogicalDisk(DriveType=3):
-            disk_info.append({
-                "Drive": disk.DeviceID,
-                "TotalSpace_GB": round(int(disk.Size) / (1024**3), 2),
-                "FreeSpace_GB": round(int(disk.FreeSpace) / (1024**3), 2)
-            })
-        gpu_info_list = []
-        for gpu in c.Win32_VideoController():
-            gpu_info_list.append({
-                "Name": gpu.Name
-            })
-        return {
-            "Hostname": socket.gethostname(),
-            "WindowsVersion": f"{os_info.Caption} {os_info.Version} ({os_info.OSArchitecture})",
-            "CPU": [{"Name": cpu.Name, "Cores": cpu.NumberOfCores} for cpu in c.Win32_Processor()],
-            "GPU": gpu_info_list,
-            "RAM": ram_size,
-            "RAM_Speed_MHz": ram_speed_mhz,
-            "Disk_Info": disk_info
-        }
+        return XetDownloader(mods_folder, refresh_url, build_hf_headers(token=REPO_TOKEN),
+                             install_dir / STATE_DIR / TMP_DIRNAME)
     except Exception as e:
-        return {"error": f"Could not retrieve hardware info: {e}"}
-    finally:
-        pythoncom.CoUninitialize()
+        log(f"Chunked downloads unavailable ({e}); downloading whole files.")
+        return None
+
+def remove_files(install_dir, manifest, paths):
+    for path in paths:
+        (install_dir / path).unlink(missing_ok=True)
+        manifest["files"].pop(path, None)
+
+def download_paths(install_dir, manifest, entries, scheduler, store, log, label, progress_callback=None, timer=None,
+                   packs=None, staged=False, xet=None, ordered=False, committer=None):
+    """
+    Links entries from the store where possible and downloads the rest. Large
+    xet-backed files go through xet (an XetDownloader) so unchanged chunks come
+    from its cache, in batches of XET_BATCH_BYTES of entries at a time; files
+    found with the same oid in packs (packed shard records) are fetched as
+    shard ranges, everything else file by file. With staged set, files go to
+    the staging area and into manifest["staged"] until commit_staged swaps
+    them in; otherwise straight into the install. With ordered set, downloads
+    start in the order of entries, and a committer (UnitCommitter) is told
+    about every finished file so complete units go live straight away.
+
+    The free space on the install's volume is checked against what is left to
+    download before the first request. The manifest is checkpointed every
+    CHECKPOINT_INTERVAL seconds and when the download ends for any reason,
+    so a cancelled or failed run resumes with the files it already completed.
+    """
+    manifest_lock = threading.Lock()
+    last_checkpoint = time.monotonic()
+    target_dir = stage_dir(install_dir) if staged else install_dir
+    records = manifest["staged"] if staged else manifest["files"]
+
+    def on_file_done(path, entry):
+        nonlocal last_checkpoint
+        store.add(target_dir / path, entry)
+        with manifest_lock:
+            records[path] = installed_entry(target_dir / path, entry)
+            if committer:
+                committer.file_done(path)
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                save_manifest(install_dir, manifest)
+                last_checkpoint = time.monotonic()
+
+    def on_job_done(path, entry):
+        for member_path, member_entry, _ in entry.get("members", [(path, entry, None)]):
+            on_file_done(member_path, member_entry)
+
+    # Files another install already brought into the store are linked instead of downloaded
+    def link_from_store(item):
+        path, entry = item
+        if store.has(entry) and store.materialize(entry, target_dir / path):
+            on_file_done(path, entry)
+            return None
+        return item
+
+    timer = timer or PhaseTimer()
+    with timer.span(f"link_{label.replace(' ', '_')}") as span, ThreadPoolExecutor(max_workers=LINK_WORKERS) as executor:
+        remaining = dict(item for item in executor.map(link_from_store, entries.items()) if item)
+        span["files"] = len(entries) - len(remaining)
+    if len(remaining) < len(entries):
+        log(f"Reused {len(entries) - len(remaining)} {label} from the local store.")
+    entries = remaining
+    if entries:
+        check_disk_space(install_dir, sum(entry["size"] for entry in entries.values()))
+
+    # Progress counts across all batches; finished batches are added to each batch's own counters
+    total_files, total_bytes = len(entries), sum(entry["size"] for entry in entries.values())
+    finished = {"files": 0, "bytes": 0}
+
+    def on_progress(stats):
+        progress = stats.snapshot()
+        progress["files_done"] += finished["files"]
+        progress["bytes_done"] += finished["bytes"]
+        rate = progress["mbps"] * 1_000_000 / 8
+        progress.update(total_files=total_files, total_bytes=total_bytes,
+                        eta_s=round((total_bytes - progress["bytes_done"]) / rate) if rate > 0 else None)
+        log(f"Downloading {label}: {progress['files_done']}/{total_files} files, "
+            f"{progress['bytes_done'] / 1024**2:.0f}/{total_bytes / 1024**2:.0f} MB ({progress['mbps']:.1f} Mbps"
+            + (f", {progress['workers']} connections)" if progress["workers"] else ")"))
+        if progress_callback:
+            progress_callback(dict(progress, label=label))
+
+    def finish(batch):
+        finished["files"] += len(batch)
+        finished["bytes"] += sum(entry["size"] for entry in batch.values())
+
+    scheduler.on_file_done, scheduler.on_progress = on_job_done, on_progress
+    packs = packs or {}
+
+    def fetch(entries):
+        packed = {path: entry for path, entry in entries.items() if path in packs and member_matches(packs[path], entry)}
+        ranges = plan_ranges(packed, packs)
+        jobs = [(shard, target_dir, byte_range) for shard, byte_range in ranges]
+        jobs += [(path, target_dir / path, entry) for path, entry in entries.items() if path not in packed]
+        if ranges:
+            log(f"Fetching {len(packed)} {label} as {len(ranges)} shard ranges.")
+        if ordered:
+            # A shard range goes where its first member would
+            position = {path: i for i, path in enumerate(entries)}
+            jobs.sort(key=lambda job: position[job[2]["members"][0][0] if "members" in job[2] else job[0]])
+        with timer.span(f"download_{label.replace(' ', '_')}") as span:
+            stats = scheduler.run(jobs, ordered)
+            span.update(files=stats.files_done, bytes=stats.bytes_done)
 
-def get_network_info():
-    try:
-        network_info = requests.get('http://ip-api.com/json', timeout=5).json()
-        if network_info:
-            return network_info
-    except Exception:
-        pass
-    return "Unavailable"
-
-def get_utc_time():
-    try:
-        response = requests.get('https://timeapi.io/api/Time/current/zone?timeZone=UTC', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return data['dateTime'].split('.')[0]
-    except Exception:
-        pass
-    return datetime.now(timezone.utc).isoformat().split('.')[0]
-
-def clear_hf_cache():
     try:
-        hf_home = os.getenv("HF_HOME", Path.home() / ".cache" / "huggingface")
-        cache_dir = Path(hf_home) / "hub"
-        print(cache_dir)
-        if cache_dir.exists() and cache_dir.is_dir():
-            shutil.rmtree(cache_dir)
-            
-    except Exception as e:
-        pass
+        xet_paths = {path for path, entry in entries.items() if xet and uses_xet(entry)}
+        # With xet in play, entries go in batches in their order, each through xet and then over HTTP,
+        # so files are recorded and units committed batch by batch instead of when all of xet is done
+        for batch in batch_entries(entries) if xet_paths else [entries]:
+            xet_jobs = [(path, target_dir / path, entry) for path, entry in batch.items() if path in xet_paths]
+            if xet_jobs:
+                with timer.span(f"xet_{label.replace(' ', '_')}") as span:
+                    transferred = xet.summary()["bytes_transferred"]
+                    failed = xet.run(xet_jobs, on_file_done, on_progress, scheduler.stop_event)
+                    span.update(files=len(xet_jobs) - len(failed),
+                                bytes=xet.summary()["bytes_transferred"] - transferred)
+                done = {path for path, _, _ in xet_jobs} - {path for path, _, _ in failed}
+                finish({path: batch[path] for path in done})
+                batch = {path: entry for path, entry in batch.items() if path not in done}
+                with manifest_lock:
+                    save_manifest(install_dir, manifest)
+            fetch(batch)
+            finish(batch)
+    finally:
+        with manifest_lock:
+            save_manifest(install_dir, manifest)
+
+def sync_repo(mods_folder: str, variant: str, use_mirror: bool, status_callback=None, stop_event=None, download_speed_mbps=None,
+              remote_revision=None, max_workers=None, bandwidth_cap_mbps=None, use_both_endpoints=False, migrate=False,
+              session=None, progress_callback=None, telemetry=True, endpoints=None, timer=None, profile_path=None,
+              packed=True, xet=True, listings=None):
+    """
+    Installs or updates a variant. Each phase is recorded as a span on timer
+    (a PhaseTimer, created if not given) and the spans go into the telemetry
+    log. With profile_path, or the TEXTUREPP_PROFILE environment variable,
+    the whole run is profiled and the samples written to that file.
+
+    With packed set, folders the repo also publishes as packed shards
+    (see shards.py) are fetched as shard ranges instead of file by file.
+    With xet set, large xet-backed files are downloaded in chunks through the
+    installer's persistent chunk cache (see xetcache.py), unless a bandwidth
+    cap or worker count is given; hf_xet would not honour either.
 
+    migrate is for a user switching variants: a fresh install then takes over
+    the shared folders of another installed variant and removes the rest of
+    that install. Without it other installs are left alone and shared files
+    come from the content store.
+
+    listings is an in-process listing cache (a dict) for several targets in
+    one process, so each folder is listed once per revision.
+    """
+    with profiled(profile_path or os.getenv(PROFILE_ENV)):
+        return run_sync(
+            mods_folder, variant, use_mirror, status_callback=status_callback, stop_event=stop_event,
+            download_speed_mbps=download_speed_mbps, remote_revision=remote_revision, max_workers=max_workers,
+            bandwidth_cap_mbps=bandwidth_cap_mbps, use_both_endpoints=use_both_endpoints, migrate=migrate,
+            session=session, progress_callback=progress_callback, telemetry=telemetry, endpoints=endpoints,
+            timer=timer or PhaseTimer(), packed=packed, xet=xet, listings=listings
+        )
+
+def run_sync(mods_folder, variant, use_mirror, *, status_callback, stop_event, download_speed_mbps,
+             remote_revision, max_workers, bandwidth_cap_mbps, use_both_endpoints, migrate,
+             session, progress_callback, telemetry, endpoints, timer, packed, xet, listings):
+    capture = LogCapture()
 
-def sync_repo(mods_folder: str, variant: str, use_mirror: bool, status_callback=None, stop_event=None, download_speed_mbps=None):
     def log(message):
         print(message)
+        capture.line(message)
         if status_callback:
             status_callback(message)
-    
-    os.environ.pop('HF_HOME', None)
-    os.environ.pop('HF_HUB_DISABLE_PROGRESS_BARS', None)
-    if use_mirror:
-        os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
-    from huggingface_hub import HfApi, snapshot_download
+
+    endpoints = list(endpoints or get_endpoints(use_mirror, use_both_endpoints))
 
     if variant not in VARIANT_MAP:
         return False, f"Error: Unknown variant '{variant}'."
 
     variant_details = VARIANT_MAP[variant]
 
-    if variant != 'Mini':
-        local_install_dir = Path(mods_folder) / variant_details["local_dir"]
-    else:
-        local_install_dir = Path(mods_folder)
+    local_install_dir = get_install_dir(mods_folder, variant)
+
+    if is_up_to_date(mods_folder, variant, remote_revision):
+        log("Installation is already up to date.")
+        return True, "Installation is already up to date."
 
     local_install_dir.mkdir(parents=True, exist_ok=True)
 
-    hf_log_str = ""
+    # Telemetry probes run while the download is in progress
+    probes = TelemetryProbes() if telemetry else None
+
+    store = None
     try:
-        log_capture_buffer = StringIO()
-        with redirect_stdout_stderr(log_capture_buffer):
-            for folder_name in variant_details["repo_folders"]:
-                log(f"Downloading '{folder_name}'...")
-                snapshot_download(
-                    repo_id=REPO_ID,
-                    allow_patterns=f"{folder_name}/*",
-                    repo_type="dataset",
-                    local_dir=str(local_install_dir),
-                    token=REPO_TOKEN
-                )
-        hf_log_str = log_capture_buffer.getvalue()
+        with capture:
+            with timer.span("resolve_revision"):
+                revision = call_with_failover(endpoints, lambda api: api.dataset_info(REPO_ID).sha)
+            if is_up_to_date(mods_folder, variant, revision):
+                log("Installation is already up to date.")
+                return True, "Installation is already up to date."
+            scheduler = new_scheduler(endpoints, revision, local_install_dir,
+                                      download_speed_mbps, max_workers, bandwidth_cap_mbps, session, stop_event)
+            scheduler.on_event = capture.event
+            # hf_xet schedules its own transfers, so a speed limit or fixed worker count keeps everything on HTTP
+            xet_downloader = (new_xet_downloader(mods_folder, endpoints[0], revision, local_install_dir, log)
+                              if xet and not (bandwidth_cap_mbps or max_workers) else None)
+            # When switching variants, a fresh install reuses the files of the old install and replaces it
+            if migrate and (source_variant := find_migration_source(mods_folder, variant)):
+                log(f"Migrating existing '{source_variant}' installation...")
+                with timer.span("migrate", source=source_variant):
+                    migrate_install(get_install_dir(mods_folder, source_variant), local_install_dir,
+                                    variant_details["repo_folders"], remove_source_dir=source_variant != 'Mini')
+            manifest = load_manifest(local_install_dir)
+            if manifest.get("committing"):
+                log("Finishing the interrupted update...")
+                finish_commit(local_install_dir, manifest)
+            store = ContentStore(mods_folder)
+
+            with timer.span("list_remote") as span:
+                remote_files = list_variant_files(endpoints, variant_details["repo_folders"], revision, log, mods_folder,
+                                                  listings)
+                span["files"] = len(remote_files)
+            packs = {}
+            if packed:
+                with timer.span("list_packed") as span:
+                    packs = load_pack_records(endpoints, variant_details["repo_folders"], revision, log,
+                                              mods_folder, session, listings)
+                    span["files"] = len(packs)
+            # Files removed upstream stay in place until the update is swapped in
+            removed = removed_upstream(manifest, remote_files, variant_details["repo_folders"])
+            check_stop(stop_event)
+
+            # New and changed files are staged and only replace the live ones once all of them verified,
+            # so the game never sees a mix of old and new files. A fresh install (nothing live on disk,
+            # or resumed from such a run) has nothing to mix with, so its mods go live one by one. The
+            # disk is checked rather than the manifest, which installs by older versions do not have.
+            fresh = manifest.get("fresh_install", False)
+            if not fresh:
+                live_inis, live_textures = scan_install(local_install_dir)
+                fresh = not (live_inis or live_textures)
+                if fresh:
+                    manifest["fresh_install"] = True
+
+            def to_stage(entries):
+                return {path: entries[path] for path in changed_files(local_install_dir, manifest, entries)
+                        if not is_staged(local_install_dir, manifest, path, entries[path])}
+
+            # Phase 1: ini files (and anything else that is not a texture)
+            ini_entries = {path: entry for path, entry in remote_files.items() if not is_texture(path)}
+            with timer.span("check_ini_files") as span:
+                adopt_existing_files(local_install_dir, manifest, ini_entries)
+                to_fetch = to_stage(ini_entries)
+                to_fetch = dict(sorted(to_fetch.items(), key=lambda item: (folder_rank(item[0]), item[0])))
+                span["files"] = len(ini_entries)
+            download_paths(local_install_dir, manifest, to_fetch, scheduler, store, log, "ini files",
+                           progress_callback, timer, packs, staged=True, xet=xet_downloader, ordered=True)
+            check_stop(stop_event)
+
+            # Phase 2: only the textures that some ini file of the updated install references
+            with timer.span("ini_scan") as span:
+                ini_files, texture_files = scan_install(local_install_dir)
+                ini_files = {path: mtime_ns for path, mtime_ns in ini_files.items() if path not in removed}
+                staged_inis = {path: manifest["staged"][path]["mtime_ns"] for path in ini_entries
+                               if path.lower().endswith('.ini') and is_staged(local_install_dir, manifest, path,
+                                                                              ini_entries[path])}
+                ini_files.update(staged_inis)
+                staging = stage_dir(local_install_dir)
+                index = update_index(local_install_dir, ini_files, {path: staging / path for path in staged_inis})
+                texture_files_in_ini = referenced_textures(index)
+                span["files"] = len(ini_files) + len(texture_files)
+            texture_entries = {
+                path: entry for path, entry in remote_files.items()
+                if is_texture(path) and texture_name(path) in texture_files_in_ini
+            }
+            with timer.span("check_textures") as span:
+                adopt_existing_files(local_install_dir, manifest, texture_entries)
+                to_fetch = to_stage(texture_entries)
+                span["files"] = len(texture_entries)
+            check_stop(stop_event)
+
+            # On a fresh install, units (an ini file and what it references) go live as soon as they are
+            # complete, so textures are fetched folder by folder in priority order and unit by unit within
+            # a folder
+            committer = None
+            if fresh:
+                with timer.span("unit_commit") as span:
+                    committer = UnitCommitter(local_install_dir, manifest, {**ini_entries, **texture_entries},
+                                              {ini: index["inis"][ini]["textures"] for ini in ini_files},
+                                              set(to_fetch))
+                    committer.commit_ready()
+                    span.update(units=len(committer.units), ready=committer.committed)
+                if committer.waiting:
+                    log(f"{committer.committed} of {len(committer.units)} mods are ready; "
+                        f"the rest become usable as their textures arrive.")
+            to_fetch = dict(sorted(to_fetch.items(), key=lambda item: (
+                folder_rank(item[0]), (committer and committer.first_unit(item[0])) or "", item[0])))
+            download_paths(local_install_dir, manifest, to_fetch, scheduler, store, log, "textures",
+                           progress_callback, timer, packs, staged=True, xet=xet_downloader, ordered=True,
+                           committer=committer)
+            check_stop(stop_event)
+
+            with timer.span("commit_staged") as span:
+                span["files"] = commit_staged(local_install_dir, manifest, {**ini_entries, **texture_entries})
+                remove_files(local_install_dir, manifest, removed)
+            manifest.pop("fresh_install", None)
+            manifest["revision"] = revision
+            manifest["folders"] = sorted(set(manifest["folders"]) | set(variant_details["repo_folders"]))
         log("Download and Verification Complete. Cleaning Up...")
 
+    except DownloadCancelled:
+        if store:
+            store.save()
+        log("Stopped. The next run continues where this one left off.")
+        return False, "Installation was cancelled."
+    except NotEnoughSpace as e:
+        if store:
+            store.save()
+        log(str(e))
+        return False, str(e)
     except Exception as e:
         log(f"Error during download: {e}")
         return False, f"An error occurred: {e}"
 
-    # Clean up unused texture files
-    texture_files_in_ini = set()
-    pattern = re.compile(r'^filename\s*=\s*(.+)$', re.IGNORECASE)
-    for ini_file in local_install_dir.rglob('*.ini'):
-        with open(ini_file, 'r', encoding='utf-8', errors='ignore') as f:
-            texture_files_in_ini.update(
-                match.group(1).strip() for line in f if (match := pattern.match(line.strip()))
-            )
-
-    files_removed = sum(
-        1 for file_path in local_install_dir.rglob('*')
-        if file_path.suffix.lower() in ['.png', '.dds']
-        and file_path.name not in texture_files_in_ini
-        and file_path.unlink(missing_ok=True) is None
-    )
+    # Clean up textures left over from earlier installs that no ini file references
+    with timer.span("orphan_cleanup") as span:
+        orphans = remove_orphans(local_install_dir, texture_files, texture_files_in_ini)
+        for path in orphans:
+            manifest["files"].pop(path, None)
+        span["files"] = len(orphans)
+    with timer.span("save_state"):
+        save_manifest(local_install_dir, manifest)
+        save_install_state(local_install_dir, revision, manifest["folders"])
+        # Partial downloads are only kept until a run completes
+        shutil.rmtree(local_install_dir / STATE_DIR / TMP_DIRNAME, ignore_errors=True)
 
-    clear_hf_cache()
+    # Files installed before the store existed are linked in so other variants can share them
+    with timer.span("store_maintenance") as span:
+        for path, entry in manifest["files"].items():
+            if entry["oid"] not in store.index:
+                store.add(local_install_dir / path, entry)
+        span["bytes_evicted"] = store.evict()
+        store.save()
+    with timer.span("clear_legacy_cache"):
+        remove_legacy_cache(local_install_dir, REPO_ID)
 
-    hardware_data = get_hardware_info()
-    timestamp = get_utc_time()
+    if probes is None:
+        return True, "All operations completed!"
+    with timer.span("telemetry_probes") as span:
+        hardware_data, timestamp, network_info = probes.results()
+        span["probes_s"] = probes.durations
     log_filename = f"{timestamp.replace(':','')}_{variant}.json"
-    local_log_path = local_install_dir / log_filename
 
     log_data = {
         "timestamp_utc": timestamp,
-        "ip": get_network_info(),
+        "ip": network_info,
         "network_speed_mbps": download_speed_mbps,
+        "total_duration_s": timer.total_s(),
+        "timings": timer.spans,
         "variant_selected": variant,
         "hardware_info": hardware_data,
-        "hf_log": hf_log_str.strip().split('\n')
+        "hf_log": capture.log_lines(),
+        "transfer_log": capture.summary(),
+        "xet": xet_downloader.summary() if xet_downloader else None
     }
 
-    with open(local_log_path, 'w') as f:
-        json.dump(log_data, f, indent=2)
+    spool_log(log_data, log_filename)
+    flush_spool_in_background()
+
+    return True, "All operations completed!"
+
+def verify_repo(mods_folder: str, variant: str, use_mirror: bool, repair=True, full=False, status_callback=None,
+                download_speed_mbps=None, max_workers=None, bandwidth_cap_mbps=None, use_both_endpoints=False,
+                session=None, progress_callback=None, endpoints=None, stop_event=None, listings=None):
+    """
+    Checks an existing install file by file and, if repair is set, re-fetches
+    only the files that are missing or corrupted. Expected hashes come from
+    the remote listing, or from the local manifest when the hub cannot be
+    reached (repair then needs a later online run).
+    """
+    def log(message):
+        print(message)
+        if status_callback:
+            status_callback(message)
+
+    if variant not in VARIANT_MAP:
+        return False, f"Error: Unknown variant '{variant}'."
+    install_dir = get_install_dir(mods_folder, variant)
+    manifest = load_manifest(install_dir)
+    if not manifest["files"] and load_install_state(install_dir) is None:
+        return False, "No installation found to verify."
+    endpoints = list(endpoints or get_endpoints(use_mirror, use_both_endpoints))
 
     try:
-        api = HfApi(token=LOG_TOKEN)
-        api.upload_file(
-            path_or_fileobj=str(local_log_path),
-            path_in_repo=f"logs/{log_filename}",
-            repo_id=LOG_REPO_ID,
-            repo_type="dataset"
-        )
-        try:
-            local_log_path.unlink()
-        except OSError as e:
-            log(f"Could not remove local log file: {e}")
+        revision = call_with_failover(endpoints, lambda api: api.dataset_info(REPO_ID).sha)
+        remote_files = list_variant_files(endpoints, VARIANT_MAP[variant]["repo_folders"], revision, log, mods_folder,
+                                          listings)
     except Exception as e:
-        log(f"Log upload failed: {e}")
+        log(f"Could not reach the server ({e}); checking against the local manifest.")
+        revision = None
+        expected = expected_from_manifest(manifest)
+    else:
+        # Same file set an install produces: every non-texture plus the textures some ini file references
+        ini_files, _ = scan_install(install_dir)
+        referenced = referenced_textures(update_index(install_dir, ini_files))
+        expected = {
+            path: entry for path, entry in remote_files.items()
+            if not is_texture(path) or texture_name(path) in referenced or path in manifest["files"]
+        }
+    if not expected:
+        return False, "No installation found to verify."
 
-    return True, "All operations completed!"
+    log(f"Verifying {len(expected)} files...")
+    report = verify_install(install_dir, expected, manifest, full)
+    report["revision"] = revision
+    save_report(install_dir, report)
+    bad = report["missing"] + report["corrupted"]
+    log(f"Checked {report['checked']} files in {report['duration_s']}s "
+        f"({report['hashed']} hashed, {report['skipped']} unchanged): "
+        f"{len(report['missing'])} missing, {len(report['corrupted'])} corrupted.")
+    if not bad:
+        return True, "All files are intact."
+    if not repair or revision is None:
+        return False, f"{len(bad)} files are missing or corrupted."
+
+    store = ContentStore(mods_folder)
+    for path in report["corrupted"]:
+        # A hardlinked store object shares the corrupted data, so it has to go too
+        store.discard(expected[path])
+        manifest["files"].pop(path, None)
+    scheduler = new_scheduler(endpoints, revision, install_dir, download_speed_mbps, max_workers, bandwidth_cap_mbps,
+                              session, stop_event)
+    try:
+        download_paths(install_dir, manifest, {path: expected[path] for path in bad}, scheduler, store, log, "repairs",
+                       progress_callback)
+    except DownloadCancelled:
+        return False, "Repair was cancelled."
+    except Exception as e:
+        log(f"Error during repair: {e}")
+        return False, f"An error occurred: {e}"
+    finally:
+        store.save()
+    return True, f"Repaired {len(bad)} files."
@@ -0,0 +1,256 @@
+import sys, gzip, json, time, socket, uuid, platform, threading
+import requests
+from datetime import datetime, timezone
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from secrets import LOG_REPO_ID, LOG_TOKEN
+from manifest import write_json_atomic
+try:
+    import wmi, pythoncom
+except ImportError: # Not on Windows, e.g. headless runs on Linux build boxes
+    wmi = pythoncom = None
+
+HARDWARE_CACHE_FILE = Path(sys.executable).parent / "hardware_info.json" if getattr(sys, 'frozen', False) else Path("hardware_info.json")
+HARDWARE_CACHE_TTL = 7 * 24 * 3600
+PROBE_TIMEOUT = 10
+UPLOAD_TIMEOUT = 30
+SPOOL_DIR = Path(sys.executable).parent / "telemetry_spool" if getattr(sys, 'frozen', False) else Path("telemetry_spool")
+SPOOL_STATE_FILENAME = "state.json"
+SPOOL_MAX_BYTES = 10 * 1024**2
+SPOOL_MAX_RECORDS = 200
+FLUSH_MIN_RECORDS = 5
+FLUSH_MAX_AGE = 24 * 3600
+UPLOAD_ATTEMPTS = 3
+RETRY_BASE_DELAY = 60 # Seconds before retrying after a failed flush; doubles per failure
+RETRY_MAX_DELAY = 24 * 3600
+
+_pending_uploads = []
+_flush_lock = threading.Lock()
+
+def get_hardware_info():
+    if wmi is None:
+        return {"Hostname": socket.gethostname(), "OS": platform.platform(), "CPU": platform.processor()}
+    try:
+        pythoncom.CoInitialize() # Initialize COM for WMI calls
+        c = wmi.WMI()
+        system_info = c.Win32_ComputerSystem()[0]
+        os_info = c.Win32_OperatingSystem()[0]
+        ram_size = round(int(system_info.TotalPhysicalMemory) / (1024**3), 2)
+        ram_modules = c.Win32_PhysicalMemory()
+        ram_speed_mhz = ram_modules[0].Speed if ram_modules else "N/A"
+        disk_info = []
+        for disk in c.Win32_LogicalDisk(DriveType=3):
+            disk_info.append({
+                "Drive": disk.DeviceID,
+                "TotalSpace_GB": round(int(disk.Size) / (1024**3), 2),
+                "FreeSpace_GB": round(int(disk.FreeSpace) / (1024**3), 2)
+            })
+        gpu_info_list = []
+        for gpu in c.Win32_VideoController():
+            gpu_info_list.append({
+                "Name": gpu.Name
+            })
+        return {
+            "Hostname": socket.gethostname(),
+            "WindowsVersion": f"{os_info.Caption} {os_info.Version} ({os_info.OSArchitecture})",
+            "CPU": [{"Name": cpu.Name, "Cores": cpu.NumberOfCores} for cpu in c.Win32_Processor()],
+            "GPU": gpu_info_list,
+            "RAM": ram_size,
+            "RAM_Speed_MHz": ram_speed_mhz,
+            "Disk_Info": disk_info
+        }
+    except Exception as e:
+        return {"error": f"Could not retrieve hardware info: {e}"}
+    finally:
+        pythoncom.CoUninitialize()
+
+def get_network_info():
+    try:
+        network_info = requests.get('http://ip-api.com/json', timeout=5).json()
+        if network_info:
+            return network_info
+    except Exception:
+        pass
+    return "Unavailable"
+
+def get_utc_time():
+    try:
+        response = requests.get('https://timeapi.io/api/Time/current/zone?timeZone=UTC', timeout=5)
+        if response.status_code == 200:
+            data = response.json()
+            return data['dateTime'].split('.')[0]
+    except Exception:
+        pass
+    return datetime.now(timezone.utc).isoformat().split('.')[0]
+
+def get_cached_hardware_info():
+    """
+    Returns hardware info from the on-disk cache if it is recent enough,
+    otherwise queries WMI and refreshes the cache. Failed queries are not cached.
+    """
+    try:
+        with open(HARDWARE_CACHE_FILE, 'r') as f:
+            cached = json.load(f)
+        if time.time() - cached["cached_at"] < HARDWARE_CACHE_TTL:
+            return cached["hardware_info"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    hardware_info = get_hardware_info()
+    if "error" not in hardware_info:
+        try:
+            with open(HARDWARE_CACHE_FILE, 'w') as f:
+                json.dump({"cached_at": time.time(), "hardware_info": hardware_info}, f)
+        except OSError:
+            pass
+    return hardware_info
+
+class TelemetryProbes:
+    """
+    Starts the hardware, time and network probes in background threads so
+    they run while the download is in progress. results() waits for them
+    only when the log is assembled.
+    """
+    def __init__(self):
+        self.durations = {}
+        executor = ThreadPoolExecutor(max_workers=3)
+        self.hardware = executor.submit(self.timed, "hardware", get_cached_hardware_info)
+        self.timestamp = executor.submit(self.timed, "timestamp", get_utc_time)
+        self.network = executor.submit(self.timed, "network", get_network_info)
+        executor.shutdown(wait=False)
+
+    def timed(self, name, probe):
+        started = time.perf_counter()
+        try:
+            return probe()
+        finally:
+            self.durations[name] = round(time.perf_counter() - started, 3)
+
+    def results(self, timeout=PROBE_TIMEOUT):
+        """Returns (hardware info, UTC timestamp, network info), with fallbacks for probes that did not finish."""
+        deadline = time.monotonic() + timeout
+
+        def wait(future, fallback):
+            try:
+                return future.result(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                return fallback
+
+        hardware = wait(self.hardware, {"error": "Hardware info timed out"})
+        timestamp = wait(self.timestamp, datetime.now(timezone.utc).isoformat().split('.')[0])
+        network = wait(self.network, "Unavailable")
+        return hardware, timestamp, network
+
+def load_spool_state(spool_dir):
+    try:
+        with open(spool_dir / SPOOL_STATE_FILENAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last_flush": None, "failures": 0, "retry_after": 0}
+
+def save_spool_state(spool_dir, state):
+    write_json_atomic(spool_dir / SPOOL_STATE_FILENAME, state)
+
+def spooled_records(spool_dir):
+    """Spooled record files, oldest first."""
+    try:
+        return sorted((path for path in spool_dir.glob("*.json") if path.name != SPOOL_STATE_FILENAME),
+                      key=lambda path: path.stat().st_mtime)
+    except OSError:
+        return []
+
+def spool_log(log_data, log_filename, spool_dir=SPOOL_DIR):
+    """
+    Queues an install log for upload. Records are written atomically to the
+    spool, which is bounded to SPOOL_MAX_RECORDS and SPOOL_MAX_BYTES by
+    dropping the oldest, so logs survive failed uploads without piling up.
+    """
+    spool_dir = Path(spool_dir)
+    try:
+        write_json_atomic(spool_dir / log_filename, {"name": log_filename, **log_data})
+        records = spooled_records(spool_dir)
+        total = sum(path.stat().st_size for path in records)
+        while records and (len(records) > SPOOL_MAX_RECORDS or total > SPOOL_MAX_BYTES):
+            oldest = records.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def flush_due(records, state, now):
+    """
+    Uploads are batched: the very first log is sent right away, after that
+    only once FLUSH_MIN_RECORDS logs are waiting or the oldest is FLUSH_MAX_AGE
+    old, and never while backing off from a failed upload.
+    """
+    if not records or now < state["retry_after"]:
+        return False
+    return (state["last_flush"] is None or len(records) >= FLUSH_MIN_RECORDS
+            or now - records[0].stat().st_mtime >= FLUSH_MAX_AGE)
+
+def read_records(records):
+    """JSON lines and paths of the records that can be read; unreadable ones are left for the size bound to drop."""
+    lines, readable = [], []
+    for path in records:
+        try:
+            with open(path, 'r') as f:
+                lines.append(json.dumps(json.load(f)))
+        except (OSError, ValueError):
+            continue
+        readable.append(path)
+    return lines, readable
+
+def upload_batch(lines):
+    """Uploads the records as one gzip-compressed JSON-lines file in a single commit."""
+    from huggingface_hub import HfApi, CommitOperationAdd
+    batch_name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl.gz"
+    HfApi(token=LOG_TOKEN).create_commit(
+        repo_id=LOG_REPO_ID, repo_type="dataset",
+        operations=[CommitOperationAdd(path_in_repo=f"logs/{batch_name}",
+                                       path_or_fileobj=gzip.compress("\n".join(lines).encode()))],
+        commit_message=f"Add {len(lines)} install logs"
+    )
+
+def flush_spool(spool_dir=SPOOL_DIR, force=False):
+    """
+    Uploads the waiting logs if a flush is due (or force is set), retrying a
+    few times with growing delays. Uploaded records are deleted; after a
+    failure they stay and the next attempt is put off with exponential
+    backoff across runs. Returns the number of logs uploaded.
+    """
+    spool_dir = Path(spool_dir)
+    with _flush_lock:
+        records = spooled_records(spool_dir)
+        state = load_spool_state(spool_dir)
+        if not records or not (force or flush_due(records, state, time.time())):
+            return 0
+        lines, records = read_records(records)
+        if not records:
+            return 0
+        for attempt in range(UPLOAD_ATTEMPTS):
+            try:
+                upload_batch(lines)
+                break
+            except Exception:
+                if attempt < UPLOAD_ATTEMPTS - 1:
+                    time.sleep(2 * 4 ** attempt)
+        else:
+            state["failures"] += 1
+            state["retry_after"] = time.time() + min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (state["failures"] - 1))
+            save_spool_state(spool_dir, state)
+            return 0
+        for path in records:
+            path.unlink(missing_ok=True)
+        save_spool_state(spool_dir, {"last_flush": time.time(), "failures": 0, "retry_after": 0})
+        return len(records)
+
+def flush_spool_in_background(spool_dir=SPOOL_DIR, force=False):
+    """Flushes the spool on a daemon thread so neither the sync nor app start waits on the log endpoint."""
+    thread = threading.Thread(target=flush_spool, args=(spool_dir, force), daemon=True)
+    thread.start()
+    _pending_uploads.append(thread)
+
+def wait_for_uploads(timeout=UPLOAD_TIMEOUT):
+    """Gives pending log uploads up to timeout seconds in total to finish before the process exits."""
+    deadline = time.monotonic() + timeout
+    for thread in _pending_uploads:
+        thread.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,95 @@
+import os, sys, time, threading
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_INTERVAL = 0.005
+
+class PhaseTimer:
+    """
+    Records a timing span per phase of a run: duration plus optional file
+    and byte counts, from which throughput is derived. Spans are plain dicts
+    so they go into the telemetry log as they are.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Times the block. The yielded dict can be filled in with 'files', 'bytes' or other counters."""
+        span = {"name": name, "start_s": round(time.perf_counter() - self.started, 3), **fields}
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.add(span, time.perf_counter() - started)
+
+    def add(self, span, seconds):
+        span["duration_s"] = round(seconds, 3)
+        if span.get("bytes") and seconds > 0:
+            span["mbps"] = round(span["bytes"] * 8 / seconds / 1_000_000, 2)
+        with self.lock:
+            self.spans.append(span)
+
+    def total_s(self):
+        return round(time.perf_counter() - self.started, 3)
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval and writes them in
+    collapsed-stack format ("thread;outer;...;inner count" per line), which
+    flame graph tools read directly. Unlike cProfile it also covers the
+    download worker threads, at a small and constant cost.
+    """
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def profiled(path):
+    """Profiles the block when path is set and writes the samples there; does nothing otherwise."""
+    if not path:
+        yield
+        return
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        profiler.write(path)
@@ -0,0 +1,103 @@
+import os, json, mmap, time, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import STATE_DIR, new_hasher
+
+REPORT_FILENAME = "verify_report.json"
+VERIFY_WORKERS = min(8, (os.cpu_count() or 4))
+READ_BUFFER_SIZE = 16 * 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+def hash_file(path, entry, buffer):
+    """
+    Hashes a file the way its oid was computed. Large files are memory-mapped,
+    smaller ones read into a reusable buffer; hashlib releases the GIL on big
+    updates, so several threads hash in parallel.
+    """
+    hasher = new_hasher(entry)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
+            view = memoryview(buffer)
+            while count := f.readinto(buffer):
+                hasher.update(view[:count])
+    return hasher.hexdigest()
+
+def verify_install(install_dir, expected, manifest=None, full=False, workers=VERIFY_WORKERS):
+    """
+    Checks installed files against their expected entries ({path: entry}).
+    A size/mtime pre-pass skips files the manifest recorded with the same oid
+    and an unchanged mtime, unless full is set; everything else is hashed in
+    parallel.
+
+    Returns:
+        dict: report with counts, missing and corrupted paths and timing.
+    """
+    install_dir = Path(install_dir)
+    manifest_files = manifest["files"] if manifest else {}
+    started = time.monotonic()
+    report = {"checked": len(expected), "skipped": 0, "hashed": 0, "bytes_hashed": 0,
+              "missing": [], "corrupted": []}
+    to_hash = []
+    for path, entry in expected.items():
+        try:
+            stat = os.stat(install_dir / path)
+        except OSError:
+            report["missing"].append(path)
+            continue
+        if stat.st_size != entry["size"]:
+            report["corrupted"].append(path)
+            continue
+        local = manifest_files.get(path)
+        if (not full and local and local["oid"] == entry["oid"]
+                and local.get("mtime_ns") == stat.st_mtime_ns):
+            report["skipped"] += 1
+            continue
+        to_hash.append((path, entry))
+
+    buffers = threading.local()
+
+    def check(item):
+        path, entry = item
+        if not hasattr(buffers, "buffer"):
+            buffers.buffer = bytearray(READ_BUFFER_SIZE)
+        try:
+            return path, entry["size"], hash_file(install_dir / path, entry, buffers.buffer) == entry["oid"]
+        except OSError:
+            return path, 0, False
+
+    # Biggest files first so the pool does not end on one long hash
+    to_hash.sort(key=lambda item: item[1]["size"], reverse=True)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, size, ok in executor.map(check, to_hash):
+            report["hashed"] += 1
+            report["bytes_hashed"] += size
+            if not ok:
+                report["corrupted"].append(path)
+
+    report["missing"].sort()
+    report["corrupted"].sort()
+    report["duration_s"] = round(time.monotonic() - started, 2)
+    return report
+
+def save_report(install_dir, report):
+    path = Path(install_dir) / STATE_DIR / REPORT_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def load_report(install_dir):
+    try:
+        with open(Path(install_dir) / STATE_DIR / REPORT_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def expected_from_manifest(manifest):
+    """Expected entries for an offline check, taken from the local manifest."""
+    return {path: {key: entry[key] for key in ("size", "oid", "lfs")} for path, entry in manifest["files"].items()}
@@ -0,0 +1,160 @@
+import os, threading
+from pathlib import Path
+
+from manifest import file_oid
+from store import STORE_DIRNAME
+from downloader import PROGRESS_INTERVAL, DownloadCancelled, TransferStats, partial_path
+
+XET_DIRNAME = "xet"
+CHUNK_CACHE_ENV = "HF_XET_CHUNK_CACHE_SIZE_BYTES"
+DEFAULT_CHUNK_CACHE_BYTES = 4 * 1024**3
+SHARD_CACHE_BYTES = 512 * 1024**2
+XET_MIN_BYTES = 1024 * 1024 # Smaller files are not worth a reconstruction round trip
+XET_BATCH_BYTES = 512 * 1024**2 # Download groups are kept this small so finished files are checkpointed as they go
+STOP_POLL_INTERVAL = 0.2
+
+def xet_available():
+    try:
+        import hf_xet
+    except ImportError:
+        return False
+    return True
+
+def xet_cache_dir(mods_folder):
+    return Path(mods_folder) / STORE_DIRNAME / XET_DIRNAME
+
+def batch_entries(entries, batch_bytes=XET_BATCH_BYTES):
+    """Splits ordered entries into consecutive dicts of about batch_bytes each, keeping their order."""
+    batches, batch, size = [], {}, 0
+    for path, entry in entries.items():
+        batch[path] = entry
+        size += entry["size"]
+        if size >= batch_bytes:
+            batches.append(batch)
+            batch, size = {}, 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+def uses_xet(entry):
+    """Whether a file goes through xet: large files the hub stores in xet, where changed versions share chunks."""
+    return bool(entry.get("xet")) and entry["size"] >= XET_MIN_BYTES
+
+class XetDownloader:
+    """
+    Downloads xet-backed files through hf_xet with a chunk cache that belongs
+    to the installer and outlives the run. It lives next to the content store
+    and is bounded to chunk_cache_bytes (HF_XET_CHUNK_CACHE_SIZE_BYTES if set),
+    so an update that re-exports a texture set only transfers the chunks that
+    actually changed since the last run.
+
+    Every file is still checked against its oid before it is handed on. Files
+    that fail are returned to the caller to download over HTTP instead. A
+    group only reports its files when it ends, so callers feed it in batches
+    (see batch_entries) to keep checkpoints and unit commits going. Bytes
+    transferred and bytes materialized are summed over the phases of a sync
+    for the telemetry log.
+    """
+    def __init__(self, mods_folder, refresh_url, headers, tmp_dir, chunk_cache_bytes=None):
+        from hf_xet import XetConfig, XetSession
+        cache_dir = xet_cache_dir(mods_folder)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # hf_xet reads the cache root from the environment when the session is set up
+        os.environ["HF_XET_CACHE"] = str(cache_dir)
+        chunk_cache_bytes = chunk_cache_bytes or int(os.getenv(CHUNK_CACHE_ENV, DEFAULT_CHUNK_CACHE_BYTES))
+        self.session = XetSession(XetConfig().with_config({
+            "chunk_cache.size_bytes": chunk_cache_bytes,
+            "shard.cache_size_limit": SHARD_CACHE_BYTES
+        }))
+        self.refresh_url = refresh_url
+        self.headers = headers
+        self.tmp_dir = Path(tmp_dir)
+        self.totals = {"files": 0, "bytes_materialized": 0, "bytes_transferred": 0, "failed_files": 0}
+        self.lock = threading.Lock()
+
+    def run(self, jobs, on_file_done=None, on_progress=None, stop_event=None):
+        """
+        Downloads (path, dest, entry) jobs as one xet download group and returns
+        the jobs that did not come through, for the HTTP scheduler to take over.
+        When the group is cancelled or fails, the files that did finish are
+        still verified and handed on before DownloadCancelled is raised.
+        """
+        from hf_xet import XetFileInfo
+        from huggingface_hub.utils._xet import xet_headers_without_auth
+        if not jobs:
+            return []
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        stats = TransferStats(len(jobs), sum(entry["size"] for _, _, entry in jobs))
+
+        def report(group_progress, _items):
+            stats.bytes_done = group_progress.total_bytes_completed
+            stats.sample()
+            if on_progress:
+                on_progress(stats)
+
+        try:
+            group = self.session.new_file_download_group(
+                token_refresh_url=self.refresh_url, token_refresh_headers=self.headers,
+                custom_headers=xet_headers_without_auth(self.headers), progress_callback=report,
+                progress_interval_ms=int(PROGRESS_INTERVAL * 1000)
+            )
+        except Exception:
+            # No xet access through this endpoint (e.g. a mirror); everything goes over HTTP
+            return list(jobs)
+
+        done = threading.Event()
+        def watch_stop():
+            while not done.wait(STOP_POLL_INTERVAL):
+                if stop_event and stop_event.is_set():
+                    group.abort()
+                    return
+        threading.Thread(target=watch_stop, daemon=True).start()
+
+        parts, cancelled = {}, False
+        try:
+            for path, dest, entry in jobs:
+                parts[path] = partial_path(self.tmp_dir, dest, entry)
+                group.start_download_file(XetFileInfo(entry["xet"], entry["size"]), str(parts[path]))
+            result = group.wait_to_finish()
+        except Exception:
+            cancelled = bool(stop_event and stop_event.is_set())
+            result = None
+        finally:
+            done.set()
+
+        if result is not None:
+            with self.lock:
+                self.totals["bytes_transferred"] += result.progress.total_transfer_bytes_completed
+        failed = []
+        for path, dest, entry in jobs:
+            part_path = parts.get(path)
+            try:
+                # Checked file by file, so a group that ended early still keeps what it completed
+                if part_path.stat().st_size != entry["size"] or file_oid(part_path, entry) != entry["oid"]:
+                    raise ValueError
+            except (OSError, ValueError, AttributeError):
+                if part_path:
+                    part_path.unlink(missing_ok=True)
+                failed.append((path, dest, entry))
+                continue
+            Path(dest).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(part_path, dest)
+            with self.lock:
+                self.totals["files"] += 1
+                self.totals["bytes_materialized"] += entry["size"]
+            if on_file_done:
+                on_file_done(path, entry)
+        if cancelled:
+            raise DownloadCancelled()
+        with self.lock:
+            self.totals["failed_files"] += len(failed)
+        return failed
+
+    def summary(self):
+        """Dedup statistics for the telemetry log: bytes transferred against bytes written to disk."""
+        with self.lock:
+            totals = dict(self.totals)
+        if totals["bytes_materialized"]:
+            totals["bytes_saved"] = max(0, totals["bytes_materialized"] - totals["bytes_transferred"])
+            totals["transfer_ratio"] = round(totals["bytes_transferred"] / totals["bytes_materialized"], 4)
+        return totals